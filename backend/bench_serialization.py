@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Compare response_model serialisation with the fast JSON path.
+
+    MONGO_URL=mongodb://localhost:27017 DB_NAME=bench python bench_serialization.py [items] [rounds]
+
+No database access happens; the URL is only needed to import server.
+"""
+
+import asyncio
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+import server
+
+
+def make_items(count: int) -> List[dict]:
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "id": f"item_{uuid.uuid4().hex[:12]}",
+            "list_id": "list_bench",
+            "name": f"عنصر {i}",
+            "quantity": 2.0,
+            "unit": "kg",
+            "category": "vegetables",
+            "note": None,
+            "is_done": i % 3 == 0,
+            "priority": 1,
+            "order": i,
+            "version": i,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for i in range(count)
+    ]
+
+
+async def response_model_path(field, items: List[dict]) -> bytes:
+    content = await serialize_response(field=field, response_content=items)
+    return JSONResponse(content).body
+
+
+def fast_path(items: List[dict]) -> bytes:
+    return server.json_bytes(server.fill_defaults(items, server._ITEM_DEFAULTS))
+
+
+async def main(count: int, rounds: int):
+    items = make_items(count)
+    field = create_response_field(name="response", type_=List[server.Item])
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await response_model_path(field, items)
+    legacy = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fast_path(items)
+    fast = (time.perf_counter() - start) / rounds
+
+    encoder = "orjson" if server.orjson is not None else "json"
+    print(f"{count} items, {rounds} rounds")
+    print(f"response_model + JSONResponse: {legacy * 1000:.2f} ms")
+    print(f"fast path ({encoder}):{' ' * (12 - len(encoder))}{fast * 1000:.2f} ms")
+    print(f"speed-up: {legacy / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    asyncio.run(main(count, rounds))
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""Async load generator for the shopping list API.
+
+    python loadtest.py --base-url http://localhost:8001 --concurrency 20 --duration 60
+    python loadtest.py --in-process --concurrency 10 --duration 15 --output run.json
+    python loadtest.py --in-process --baseline run.json   # exit 1 on p95 regressions
+
+Each virtual user registers its own account, then runs the selected
+scenarios in turn until the duration is up:
+
+    auth          login, /auth/me
+    lists         list create/read/update/delete
+    items         a burst of concurrent item creates, then read/update/delete
+    sync          /sync pushing --sync-items items, then a delta sync
+    export_import /export of --export-lists lists holding --export-items
+                  items (seeded once per user), /import of the export, then
+                  deletion of the imported copies
+
+The report is JSON with throughput and p50/p95/p99 latency per endpoint.
+--in-process serves the app from this process over ASGI, backed by
+mongomock_motor when installed (otherwise MONGO_URL/DB_NAME must point at
+a local MongoDB); no server needs to be started. The generator then shares
+the app's event loop, so compare in-process runs with each other rather
+than reading them as capacity figures.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import httpx
+
+SCENARIOS = ("auth", "lists", "items", "sync", "export_import")
+PASSWORD = "LoadTest123!"
+
+
+class Recorder:
+    """Latencies and statuses per endpoint label, e.g. "POST /lists/{id}/items"."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.errors = Counter()
+
+    def record(self, endpoint: str, seconds: float, status):
+        self.latencies[endpoint].append(seconds)
+        self.statuses[endpoint][str(status)] += 1
+        if not isinstance(status, int) or status >= 400:
+            self.errors[endpoint] += 1
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for endpoint in sorted(self.latencies):
+            samples = sorted(self.latencies[endpoint])
+            endpoints[endpoint] = {
+                "requests": len(samples),
+                "errors": self.errors[endpoint],
+                "throughput_rps": round(len(samples) / elapsed, 2),
+                "mean_ms": round(sum(samples) / len(samples) * 1000, 2),
+                "p50_ms": percentile(samples, 50),
+                "p95_ms": percentile(samples, 95),
+                "p99_ms": percentile(samples, 99),
+                "max_ms": round(samples[-1] * 1000, 2),
+                "statuses": dict(self.statuses[endpoint]),
+            }
+        total = sum(len(samples) for samples in self.latencies.values())
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "requests": total,
+            "errors": sum(self.errors.values()),
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0,
+            "endpoints": endpoints,
+        }
+
+
+def percentile(samples: list, pct: float) -> float:
+    """Nearest-rank percentile of sorted samples, in milliseconds."""
+    if not samples:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(samples)))
+    return round(samples[rank - 1] * 1000, 2)
+
+
+class VirtualUser:
+    def __init__(self, http: httpx.AsyncClient, recorder: Recorder, args, number: int, run_id: str):
+        self.http = http
+        self.recorder = recorder
+        self.args = args
+        self.email = f"loadtest_{run_id}_{number}@example.com"
+        self.headers = {}
+        self.seeded_list_ids = None
+
+    async def call(self, endpoint: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.http.request(method, url, headers=self.headers, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            response, status = None, type(e).__name__
+        self.recorder.record(endpoint, time.perf_counter() - start, status)
+        if response is not None and response.status_code < 400 and response.content:
+            return response.json()
+        return None
+
+    async def register(self) -> bool:
+        body = {"email": self.email, "password": PASSWORD, "name": "Load Test"}
+        data = await self.call("POST /auth/register", "POST", "/api/auth/register", json=body)
+        if data:
+            self.headers = {"Authorization": f"Bearer {data['token']}"}
+        return bool(data)
+
+    async def auth(self):
+        data = await self.call("POST /auth/login", "POST", "/api/auth/login", json={"email": self.email, "password": PASSWORD})
+        if data:
+            self.headers = {"Authorization": f"Bearer {data['token']}"}
+        await self.call("GET /auth/me", "GET", "/api/auth/me")
+
+    async def lists(self):
+        created = []
+        for i in range(self.args.lists):
+            lst = await self.call("POST /lists", "POST", "/api/lists", json={"name": f"قائمة {i}"})
+            if lst:
+                created.append(lst["id"])
+        await self.call("GET /lists", "GET", "/api/lists")
+        for list_id in created:
+            await self.call("GET /lists/{id}", "GET", f"/api/lists/{list_id}")
+            await self.call("PUT /lists/{id}", "PUT", f"/api/lists/{list_id}", json={"name": "محدثة"})
+            await self.call("DELETE /lists/{id}", "DELETE", f"/api/lists/{list_id}")
+
+    async def items(self):
+        lst = await self.call("POST /lists", "POST", "/api/lists", json={"name": "دفعة"})
+        if not lst:
+            return
+        base = f"/api/lists/{lst['id']}/items"
+        created = await asyncio.gather(*(
+            self.call("POST /lists/{id}/items", "POST", base, json={"name": f"عنصر {i}", "quantity": 1, "unit": "kg"})
+            for i in range(self.args.items)
+        ))
+        item_ids = [item["id"] for item in created if item]
+        await self.call("GET /lists/{id}/items", "GET", base)
+        for item_id in item_ids[:max(1, len(item_ids) // 4)]:
+            await self.call("PUT /lists/{id}/items/{id}", "PUT", f"{base}/{item_id}", json={"is_done": True})
+        for item_id in item_ids[-max(1, len(item_ids) // 4):]:
+            await self.call("DELETE /lists/{id}/items/{id}", "DELETE", f"{base}/{item_id}")
+        await self.call("DELETE /lists/{id}", "DELETE", f"/api/lists/{lst['id']}")
+
+    async def sync(self):
+        list_id = f"list_{uuid.uuid4().hex[:12]}"
+        body = {
+            "lists": [{"id": list_id, "name": "مزامنة"}],
+            "items": [
+                {"id": f"item_{uuid.uuid4().hex[:12]}", "list_id": list_id, "name": f"عنصر {i}", "order": i}
+                for i in range(self.args.sync_items)
+            ],
+        }
+        data = await self.call("POST /sync (push)", "POST", "/api/sync", json=body)
+        if data:
+            await self.call("POST /sync (delta)", "POST", "/api/sync", json={"lists": [], "items": [], "since_version": data["version"]})
+        await self.call("DELETE /lists/{id}", "DELETE", f"/api/lists/{list_id}")
+
+    async def seed_export(self) -> bool:
+        """Give the account the lists and items export_import moves around."""
+        list_ids = [f"list_{uuid.uuid4().hex[:12]}" for _ in range(max(1, self.args.export_lists))]
+        body = {
+            "lists": [{"id": list_id, "name": f"تصدير {i}"} for i, list_id in enumerate(list_ids)],
+            "items": [
+                {"id": f"item_{uuid.uuid4().hex[:12]}", "list_id": list_ids[i % len(list_ids)], "name": f"عنصر {i}", "order": i}
+                for i in range(self.args.export_items)
+            ],
+        }
+        if await self.call("POST /sync (seed)", "POST", "/api/sync", json=body) is None:
+            return False
+        self.seeded_list_ids = set(list_ids)
+        return True
+
+    async def export_import(self):
+        if self.seeded_list_ids is None and not await self.seed_export():
+            return
+        exported = await self.call("GET /export", "GET", "/api/export")
+        if exported:
+            await self.call("POST /import", "POST", "/api/import", json=exported)
+        # Drop the imported copies (and lists other scenarios left behind),
+        # so every export moves the same amount of data
+        cursor = None
+        stale = []
+        while True:
+            params = {"limit": 100, **({"cursor": cursor} if cursor else {})}
+            page = await self.call("GET /lists (cleanup)", "GET", "/api/lists", params=params)
+            if not page:
+                break
+            stale += [lst["id"] for lst in page["lists"] if lst["id"] not in self.seeded_list_ids]
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        for list_id in stale:
+            await self.call("DELETE /lists/{id}", "DELETE", f"/api/lists/{list_id}")
+
+    async def run(self, deadline: float):
+        if not await self.register():
+            return
+        scenarios = [getattr(self, name) for name in self.args.scenarios]
+        step = 0
+        while time.monotonic() < deadline:
+            await scenarios[step % len(scenarios)]()
+            step += 1
+
+
+async def drive(http: httpx.AsyncClient, args) -> dict:
+    recorder = Recorder()
+    run_id = uuid.uuid4().hex[:8]
+    start = time.monotonic()
+    deadline = start + args.duration
+    users = [VirtualUser(http, recorder, args, number, run_id) for number in range(args.concurrency)]
+    await asyncio.gather(*(user.run(deadline) for user in users))
+    report = recorder.report(time.monotonic() - start)
+    report["config"] = {
+        "base_url": "in-process" if args.in_process else args.base_url,
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "scenarios": list(args.scenarios),
+        "lists": args.lists,
+        "items": args.items,
+        "sync_items": args.sync_items,
+        "export_lists": args.export_lists,
+        "export_items": args.export_items,
+    }
+    return report
+
+
+async def run_in_process(args) -> dict:
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "loadtest")
+    # The load generator is one client address; don't let it shed itself
+    os.environ.setdefault("ADMISSION_CONTROL", "false")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import server
+
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        AsyncMongoMockClient = None
+    if AsyncMongoMockClient is not None:
+        server.client = AsyncMongoMockClient()
+        server.db = server.client[os.environ["DB_NAME"]]
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with server.app.router.lifespan_context(server.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout) as http:
+            return await drive(http, args)
+
+
+async def run_remote(args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency * 4, max_keepalive_connections=args.concurrency * 4)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as http:
+        return await drive(http, args)
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Endpoints whose p95 grew by more than `tolerance` over the baseline."""
+    regressions = []
+    for endpoint, stats in report["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(endpoint)
+        if before and before["p95_ms"] > 0 and stats["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{endpoint}: p95 {before['p95_ms']}ms -> {stats['p95_ms']}ms")
+    return regressions
+
+
+def main(argv) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default=os.environ.get("LOADTEST_BASE_URL", "http://localhost:8001"))
+    parser.add_argument("--in-process", action="store_true", help="serve the app from this process over ASGI")
+    parser.add_argument("--concurrency", type=int, default=10, help="virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--lists", type=int, default=3, help="lists per lists scenario")
+    parser.add_argument("--items", type=int, default=20, help="concurrent item creates per items scenario")
+    parser.add_argument("--sync-items", type=int, default=200, help="items pushed per sync")
+    parser.add_argument("--export-lists", type=int, default=5, help="lists seeded for export_import")
+    parser.add_argument("--export-items", type=int, default=500, help="items seeded for export_import")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="earlier report to compare p95 latencies against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 growth over the baseline")
+    args = parser.parse_args(argv)
+    # One INFO line per request would drown the report
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown or not args.scenarios:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown)) or '(none given)'}")
+
+    report = asyncio.run(run_in_process(args) if args.in_process else run_remote(args))
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION  {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Database maintenance commands.
+
+    python manage.py indexes         report missing, unknown and unused indexes
+    python manage.py ensure-indexes  create every declared index
+    python manage.py migrate         apply pending migrations
+"""
+
+import argparse
+import asyncio
+import sys
+
+from server import INDEX_SPECS, client, db, ensure_indexes, run_migrations
+
+
+async def report_indexes() -> int:
+    problems = 0
+    for collection, specs in INDEX_SPECS.items():
+        existing = await db[collection].index_information()
+        declared = {options["name"] for _, options in specs}
+
+        usage = {}
+        try:
+            async for stat in db[collection].aggregate([{"$indexStats": {}}]):
+                usage[stat["name"]] = stat["accesses"]["ops"]
+        except Exception as e:
+            print(f"{collection}: index usage unavailable ({e})")
+
+        for keys, options in specs:
+            if options["name"] not in existing:
+                problems += 1
+                print(f"MISSING  {collection}.{options['name']} {keys}")
+
+        for name, info in existing.items():
+            if name == "_id_":
+                continue
+            if name not in declared:
+                print(f"UNKNOWN  {collection}.{name} {info['key']}")
+            if usage.get(name) == 0:
+                print(f"UNUSED   {collection}.{name} (0 ops since last restart)")
+
+    if not problems:
+        print("All declared indexes present")
+    return 1 if problems else 0
+
+
+async def main(argv) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["indexes", "ensure-indexes", "migrate"])
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "indexes":
+            return await report_indexes()
+        if args.command == "ensure-indexes":
+            failed = await ensure_indexes()
+            for name in failed:
+                print(f"FAILED   {name}")
+            return 1 if failed else 0
+        applied = await run_migrations()
+        print(f"Applied migrations: {applied or 'none'}")
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
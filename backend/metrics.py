@@ -0,0 +1,249 @@
+"""Minimal Prometheus metrics: counters, gauges and histograms.
+
+Metrics are created once at import time; recording is a dict lookup and an
+addition under a lock, so instrumenting a request costs microseconds.
+Labels are passed as a tuple in the order the metric declared them.
+"""
+
+import asyncio
+import bisect
+import contextvars
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import monitoring
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: tuple = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in values
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels: tuple = (), amount: float = 1):
+        self.inc(labels, -amount)
+
+    def set(self, value: float, labels: tuple = ()):
+        with self._lock:
+            self._values[labels] = value
+
+
+class CallbackGauge(_Metric):
+    """A gauge (or counter) read from `collect()` -> {labels: value} at scrape time."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...], collect: Callable[[], Dict[tuple, float]], kind: str = "gauge"):
+        super().__init__(name, help_text, labelnames)
+        self.collect = collect
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in self.collect().items()
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...], buckets: Iterable[float]):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket (+Inf last), sum]
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, labels: tuple = ()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def count(self, labels: tuple = ()) -> int:
+        entry = self._values.get(labels)
+        return sum(entry[0]) if entry else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        lines = self.header()
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="%s"' % _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, *metrics: _Metric):
+        self._metrics.extend(metrics)
+        return metrics[0] if len(metrics) == 1 else metrics
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...], buckets: Iterable[float]) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def callback(self, name: str, help_text: str, labelnames: Tuple[str, ...], collect, kind: str = "gauge") -> CallbackGauge:
+        return self.register(CallbackGauge(name, help_text, labelnames, collect, kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class DBProfile:
+    """Mongo commands issued while handling one request."""
+
+    def __init__(self):
+        # (collection, command, seconds); appended from driver threads
+        self.commands: List[tuple] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.commands)
+
+    @property
+    def seconds(self) -> float:
+        return sum(seconds for _, _, seconds in self.commands)
+
+    def breakdown(self) -> List[tuple]:
+        """(collection.command, calls, seconds), slowest first."""
+        totals = {}
+        for collection, command, seconds in list(self.commands):
+            name = f"{collection}.{command}" if collection else command
+            calls, total = totals.get(name, (0, 0.0))
+            totals[name] = (calls + 1, total + seconds)
+        return sorted(((name, calls, total) for name, (calls, total) in totals.items()), key=lambda entry: -entry[2])
+
+    def server_timing(self) -> str:
+        entries = [f'db;dur={self.seconds * 1000:.1f};desc="{self.count} calls"']
+        entries.extend(f'{name};dur={seconds * 1000:.1f};desc="x{calls}"' for name, calls, seconds in self.breakdown())
+        return ", ".join(entries)
+
+
+# The profile of the request being handled; Motor copies the context into
+# its executor threads, so command events see it too
+current_db_profile: contextvars.ContextVar = contextvars.ContextVar("current_db_profile", default=None)
+
+
+MONGO_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo command listener counting and timing commands per collection.
+
+    Pass it to the client as event_listeners=[...]; callbacks run on the
+    driver's threads, hence the locks in the metrics. Commands are also
+    added to the current request's DBProfile, if any.
+    """
+
+    def __init__(self):
+        self.commands = Counter(
+            "mongodb_commands_total", "MongoDB commands by collection, command and outcome",
+            ("collection", "command", "outcome")
+        )
+        self.duration = Histogram(
+            "mongodb_command_duration_seconds", "MongoDB command round-trip time",
+            ("collection", "command"), MONGO_LATENCY_BUCKETS
+        )
+        self._collections: Dict[tuple, str] = {}
+
+    def started(self, event):
+        # getMore names its collection separately; its own value is the cursor id
+        key = "collection" if event.command_name == "getMore" else event.command_name
+        collection = event.command.get(key)
+        if not isinstance(collection, str):
+            collection = ""
+        self._collections[(event.connection_id, event.request_id)] = collection
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+
+    def failed(self, event):
+        self._finish(event, "failure")
+
+    def _finish(self, event, outcome: str):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        seconds = event.duration_micros / 1e6
+        self.commands.inc((collection, event.command_name, outcome))
+        self.duration.observe(seconds, (collection, event.command_name))
+        profile = current_db_profile.get()
+        if profile is not None:
+            profile.commands.append((collection, event.command_name, seconds))
+
+
+async def monitor_loop_lag(lag_gauge: Gauge, lag_histogram: Optional[Histogram], interval: float):
+    """Sleep `interval` forever; the overshoot is how long the loop was blocked."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        lag_gauge.set(lag)
+        if lag_histogram is not None:
+            lag_histogram.observe(lag)
@@ -1,25 +1,63 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
+from starlette.datastructures import Headers, MutableHeaders
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, CursorType, DeleteOne, InsertOne, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, OperationFailure
 import os
+import asyncio
+import json
+import math
+import random
+import re
+import unicodedata
+import zlib
+import codecs
+import base64
+import bisect
+import hashlib
+import hmac
+import heapq
+import itertools
 import logging
+import threading
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, model_validator
+from typing import List, Literal, Optional, Union
 import uuid
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, nullcontext
 from datetime import datetime, timezone, timedelta
 import bcrypt
 import jwt
 import httpx
 
+from metrics import DBProfile, MetricsRegistry, MongoCommandMetrics, current_db_profile, monitor_loop_lag
+
+try:
+    import orjson
+except ImportError:  # optional speed-up; falls back to the stdlib encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# tz_aware so stored UTC datetimes come back timezone-aware; command
+# monitoring feeds the Mongo series of /metrics
+mongo_command_metrics = MongoCommandMetrics()
+client = AsyncIOMotorClient(mongo_url, tz_aware=True, event_listeners=[mongo_command_metrics])
 db = client[os.environ['DB_NAME']]
 
 # JWT Config
@@ -27,6 +65,83 @@ JWT_SECRET = os.environ.get('JWT_SECRET', 'shopping-list-secret-key-2024')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_DAYS = 7
 
+# Principal cache config
+AUTH_CACHE_TTL_SECONDS = float(os.environ.get('AUTH_CACHE_TTL_SECONDS', '60'))
+AUTH_CACHE_MAX_ENTRIES = int(os.environ.get('AUTH_CACHE_MAX_ENTRIES', '10000'))
+
+# Autocomplete config
+SUGGEST_CACHE_TTL_SECONDS = float(os.environ.get('SUGGEST_CACHE_TTL_SECONDS', '300'))
+SUGGEST_CACHE_MAX_USERS = int(os.environ.get('SUGGEST_CACHE_MAX_USERS', '1000'))
+SUGGEST_MAX_TERMS_PER_USER = int(os.environ.get('SUGGEST_MAX_TERMS_PER_USER', '5000'))
+
+# OAuth session-data provider (point AUTH_PROVIDER_URL at a stand-in for tests)
+AUTH_PROVIDER_URL = os.environ.get('AUTH_PROVIDER_URL', 'https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data')
+AUTH_PROVIDER_TIMEOUT_SECONDS = float(os.environ.get('AUTH_PROVIDER_TIMEOUT_SECONDS', '5'))
+AUTH_PROVIDER_RETRIES = int(os.environ.get('AUTH_PROVIDER_RETRIES', '2'))
+AUTH_PROVIDER_BACKOFF_SECONDS = float(os.environ.get('AUTH_PROVIDER_BACKOFF_SECONDS', '0.2'))
+AUTH_PROVIDER_MAX_CONNECTIONS = int(os.environ.get('AUTH_PROVIDER_MAX_CONNECTIONS', '20'))
+AUTH_BREAKER_FAILURES = int(os.environ.get('AUTH_BREAKER_FAILURES', '5'))
+AUTH_BREAKER_RESET_SECONDS = float(os.environ.get('AUTH_BREAKER_RESET_SECONDS', '30'))
+SESSION_EXCHANGE_CACHE_SECONDS = float(os.environ.get('SESSION_EXCHANGE_CACHE_SECONDS', '60'))
+
+# Password hashing config
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+BCRYPT_MAX_WORKERS = int(os.environ.get('BCRYPT_MAX_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+# Serialise hot read paths directly instead of re-validating through response_model
+FAST_JSON_RESPONSES = os.environ.get('FAST_JSON_RESPONSES', 'true').lower() == 'true'
+
+# Response/request compression config
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '4'))
+MAX_DECOMPRESSED_BODY_BYTES = int(os.environ.get('MAX_DECOMPRESSED_BODY_BYTES', str(64 * 1024 * 1024)))
+
+# Real-time change stream config; EVENT_BUS=mongo shares events between workers
+STREAM_QUEUE_SIZE = int(os.environ.get('STREAM_QUEUE_SIZE', '100'))
+STREAM_HEARTBEAT_SECONDS = float(os.environ.get('STREAM_HEARTBEAT_SECONDS', '25'))
+STREAM_TICKET_SECONDS = int(os.environ.get('STREAM_TICKET_SECONDS', '60'))
+EVENT_BUS = os.environ.get('EVENT_BUS', 'local').lower()
+EVENT_BUS_COLLECTION = os.environ.get('EVENT_BUS_COLLECTION', 'change_events')
+EVENT_BUS_COLLECTION_BYTES = int(os.environ.get('EVENT_BUS_COLLECTION_BYTES', str(16 * 1024 * 1024)))
+
+# Admission control; per-class limits are in ADMISSION_LIMITS (JSON overrides via env)
+ADMISSION_CONTROL = os.environ.get('ADMISSION_CONTROL', 'true').lower() == 'true'
+ADMISSION_MAX_BUCKETS = int(os.environ.get('ADMISSION_MAX_BUCKETS', '100000'))
+# Client IPs come from X-Forwarded-For only behind proxies we run. Set
+# TRUSTED_PROXY_HOPS to the number of proxies in front of the app (1 for a
+# single ingress) and make sure it can't be reached around them; each one
+# appends the address it saw, so only the last that many entries are ours.
+# With the default 0 the header is ignored and the socket peer is used.
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', '0'))
+# Per-IP buckets need real client addresses: behind an ingress without
+# TRUSTED_PROXY_HOPS every client shares the ingress's address, and the
+# per-IP limits would become limits for the whole user base. Set
+# ADMISSION_IP_LIMITS=true when clients connect to the app directly.
+ADMISSION_IP_LIMITS = os.environ.get('ADMISSION_IP_LIMITS', 'true' if TRUSTED_PROXY_HOPS > 0 else 'false').lower() == 'true'
+
+# /metrics answers scrapers sending METRICS_TOKEN as a bearer token. Without
+# a token it is 404 unless METRICS_PUBLIC=true, e.g. behind a private port.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+METRICS_PUBLIC = os.environ.get('METRICS_PUBLIC', 'false').lower() == 'true'
+LOOP_LAG_INTERVAL_SECONDS = float(os.environ.get('LOOP_LAG_INTERVAL_SECONDS', '0.5'))
+
+# Per-request Mongo profiling. Profile headers go on every response with
+# DB_PROFILE_HEADERS=true, otherwise only on requests sending
+# X-DB-Profile: <DB_PROFILE_TOKEN>; unset, nobody can ask for them
+DB_PROFILE_ENABLED = os.environ.get('DB_PROFILE_ENABLED', 'true').lower() == 'true'
+DB_PROFILE_HEADERS = os.environ.get('DB_PROFILE_HEADERS', 'false').lower() == 'true'
+DB_PROFILE_TOKEN = os.environ.get('DB_PROFILE_TOKEN')
+DB_PROFILE_SLOW_MS = float(os.environ.get('DB_PROFILE_SLOW_MS', '500'))
+
+# A change version reserved by a write that never released it (a crashed
+# worker) stops holding back the version /sync reports after this long
+CHANGE_RESERVATION_TIMEOUT_SECONDS = float(os.environ.get('CHANGE_RESERVATION_TIMEOUT_SECONDS', '600'))
+
+# Run index bootstrap and pending migrations when the app starts
+DB_BOOTSTRAP_ON_STARTUP = os.environ.get('DB_BOOTSTRAP_ON_STARTUP', 'true').lower() == 'true'
+
 # Create the main app
 app = FastAPI()
 
@@ -65,9 +180,33 @@ class ShoppingList(BaseModel):
     id: str
     user_id: str
     name: str
+    version: int = 0
     created_at: datetime
     updated_at: datetime
 
+class ShoppingListPage(BaseModel):
+    lists: List[ShoppingList]
+    limit: int
+    next_cursor: Optional[str] = None
+
+class CategoryStats(BaseModel):
+    category: Optional[str] = None
+    total: int
+    done: int
+
+class ListStats(BaseModel):
+    total: int = 0
+    done: int = 0
+    categories: List[CategoryStats] = []
+
+class ShoppingListSummary(ShoppingList):
+    stats: ListStats
+
+class ShoppingListSummaryPage(BaseModel):
+    lists: List[ShoppingListSummary]
+    limit: int
+    next_cursor: Optional[str] = None
+
 class ItemCreate(BaseModel):
     name: str
     quantity: Optional[float] = None
@@ -97,32 +236,148 @@ class Item(BaseModel):
     note: Optional[str] = None
     is_done: bool = False
     priority: Optional[int] = None
-    order: int = 0
+    # Fractional after a move (see move_item); whole numbers otherwise
+    order: Union[int, float] = 0
+    version: int = 0
     created_at: datetime
     updated_at: datetime
 
+class ItemMove(BaseModel):
+    # Neighbours after the move; None means the top / bottom of the list
+    after_id: Optional[str] = None
+    before_id: Optional[str] = None
+
+class ItemBatchOperation(BaseModel):
+    op: Literal["create", "update", "delete"]
+    id: Optional[str] = None
+    data: Optional[ItemUpdate] = None
+
+    @model_validator(mode="after")
+    def check_fields(self):
+        if self.op == "create" and (self.data is None or self.data.name is None):
+            raise ValueError("create requires data.name")
+        if self.op != "create" and not self.id:
+            raise ValueError(f"{self.op} requires id")
+        return self
+
+class ItemBatchRequest(BaseModel):
+    operations: List[ItemBatchOperation] = Field(max_length=500)
+
+class ItemPage(BaseModel):
+    items: List[Item]
+    limit: int
+    next_cursor: Optional[str] = None
+
 class ExportData(BaseModel):
     lists: List[dict]
     items: List[dict]
     exported_at: datetime
 
-class ImportData(BaseModel):
-    lists: List[dict]
-    items: List[dict]
-
 class SyncRequest(BaseModel):
     lists: List[dict]
     items: List[dict]
     last_sync: Optional[str] = None
+    # Change version from a previous sync response; omit for a full sync
+    since_version: Optional[int] = None
 
 # ============ HELPER FUNCTIONS ============
 
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
 
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
+def password_needs_rehash(hashed: str) -> bool:
+    # bcrypt hashes look like $2b$<cost>$<salt+digest>
+    try:
+        return int(hashed.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+class PasswordHasher:
+    """Runs bcrypt on a dedicated thread pool so it never blocks the event loop.
+
+    bcrypt releases the GIL, so max_workers is the number of hashes that can
+    run in parallel; further calls wait in the executor queue.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = None
+        # counters are updated from both the event loop and worker threads
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.calls = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.hash_time_total = 0.0
+        self.hash_time_max = 0.0
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(verify_password, password, hashed)
+
+    async def _run(self, func, *args):
+        submitted = time.perf_counter()
+        with self._lock:
+            self.queued += 1
+
+        def timed():
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+            try:
+                return func(*args)
+            finally:
+                self._record(started - submitted, time.perf_counter() - started)
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bcrypt")
+        future = self._executor.submit(timed)
+        future.add_done_callback(self._dequeue_cancelled)
+        # Cancelling the awaiting request cancels the future while it is queued
+        return await asyncio.wrap_future(future)
+
+    def _dequeue_cancelled(self, future):
+        # A call cancelled before a worker picked it up never runs timed()
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    def _record(self, queue_wait: float, hash_time: float):
+        with self._lock:
+            self.running -= 1
+            self.calls += 1
+            self.queue_wait_total += queue_wait
+            self.queue_wait_max = max(self.queue_wait_max, queue_wait)
+            self.hash_time_total += hash_time
+            self.hash_time_max = max(self.hash_time_max, hash_time)
+
+    def stats(self) -> dict:
+        calls = self.calls or 1
+        return {
+            "max_workers": self.max_workers,
+            "queued": self.queued,
+            "running": self.running,
+            "calls": self.calls,
+            "queue_wait_avg_ms": self.queue_wait_total / calls * 1000,
+            "queue_wait_max_ms": self.queue_wait_max * 1000,
+            "hash_time_avg_ms": self.hash_time_total / calls * 1000,
+            "hash_time_max_ms": self.hash_time_max * 1000,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+password_hasher = PasswordHasher(BCRYPT_MAX_WORKERS)
+
 def create_jwt_token(user_id: str, email: str) -> str:
     payload = {
         "user_id": user_id,
@@ -131,6 +386,14 @@ def create_jwt_token(user_id: str, email: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+def create_stream_ticket(user_id: str) -> str:
+    payload = {
+        "user_id": user_id,
+        "purpose": "stream",
+        "exp": datetime.now(timezone.utc) + timedelta(seconds=STREAM_TICKET_SECONDS)
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
 def decode_jwt_token(token: str) -> dict:
     try:
         return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
@@ -139,11 +402,92 @@ def decode_jwt_token(token: str) -> dict:
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+class PrincipalCache:
+    """Bounded LRU cache of authenticated users with per-entry TTL.
+
+    Keys are ("session", session_token) for cookie sessions and
+    ("user", user_id) for verified JWTs.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, user = entry
+        if expires_at <= time.monotonic():
+            self._discard(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return user
+
+    def set(self, key: tuple, user: dict, ttl_seconds: Optional[float] = None):
+        if self.max_entries <= 0:
+            return
+        ttl = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        if ttl <= 0:
+            return
+        self._discard(key)
+        self._entries[key] = (time.monotonic() + ttl, user)
+        self._keys_by_user.setdefault(user["user_id"], set()).add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+
+    def invalidate(self, key: tuple):
+        self._discard(key)
+
+    def invalidate_user(self, user_id: str):
+        for key in list(self._keys_by_user.get(user_id, ())):
+            self._discard(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_user.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def _discard(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_id = entry[1]["user_id"]
+        keys = self._keys_by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[user_id]
+
+principal_cache = PrincipalCache(AUTH_CACHE_TTL_SECONDS, AUTH_CACHE_MAX_ENTRIES)
+
 async def get_current_user(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    user = await authenticate(request, credentials)
+    # Per-user buckets are keyed on the verified user, so a fresh login
+    # does not come with a fresh quota
+    await admission.admit_user(request.scope, user["user_id"])
+    return user
+
+async def authenticate(request: Request, credentials: Optional[HTTPAuthorizationCredentials]) -> dict:
     # Check cookie first
     session_token = request.cookies.get("session_token")
     
     if session_token:
+        cache_key = ("session", session_token)
+        user = principal_cache.get(cache_key)
+        if user:
+            return user
+        
         # Google OAuth session
         session = await db.user_sessions.find_one({"session_token": session_token}, {"_id": 0})
         if session:
@@ -152,32 +496,199 @@ async def get_current_user(request: Request, credentials: HTTPAuthorizationCrede
                 expires_at = datetime.fromisoformat(expires_at)
             if expires_at.tzinfo is None:
                 expires_at = expires_at.replace(tzinfo=timezone.utc)
-            if expires_at > datetime.now(timezone.utc):
+            now = datetime.now(timezone.utc)
+            if expires_at > now:
                 user = await db.users.find_one({"user_id": session["user_id"]}, {"_id": 0})
                 if user:
+                    principal_cache.set(cache_key, user, (expires_at - now).total_seconds())
                     return user
     
     # Check Authorization header (JWT)
     if credentials:
         token = credentials.credentials
         payload = decode_jwt_token(token)
-        user = await db.users.find_one({"user_id": payload["user_id"]}, {"_id": 0})
+        # Stream tickets only open /stream
+        if "purpose" in payload:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        user = await jwt_user(payload["user_id"])
         if user:
             return user
     
     raise HTTPException(status_code=401, detail="Not authenticated")
 
+async def jwt_user(user_id: str) -> Optional[dict]:
+    cache_key = ("user", user_id)
+    user = principal_cache.get(cache_key)
+    if user:
+        return user
+    user = await db.users.find_one({"user_id": user_id}, {"_id": 0})
+    if user:
+        principal_cache.set(cache_key, user)
+    return user
+
+# ============ AUTH PROVIDER ============
+
+class CircuitBreaker:
+    """Fails fast after repeated provider failures, then lets one call probe.
+
+    Closed until `failure_threshold` consecutive failures; open for
+    `reset_seconds`; then half-open, where the next call's outcome closes
+    or reopens it.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._probe_started = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        # A probe that never reported back is given up on after reset_seconds
+        now = time.monotonic()
+        if state == "half-open" and (self._probe_started is None or now - self._probe_started >= self.reset_seconds):
+            self._probe_started = now
+            return True
+        return False
+
+    def retry_after(self) -> int:
+        if self.opened_at is None:
+            return 0
+        return max(1, math.ceil(self.opened_at + self.reset_seconds - time.monotonic()))
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probe_started is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._probe_started = None
+
+class AuthProviderClient:
+    """App-scoped pooled client for the OAuth session-data endpoint.
+
+    Transport errors, timeouts, 429 and 5xx are retried with full-jitter
+    exponential backoff and count towards the circuit breaker; any other
+    non-200 answer means the session id is invalid.
+    """
+
+    def __init__(self, url: str, timeout: float, retries: int, max_connections: int, breaker: CircuitBreaker, transport=None):
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        self.max_connections = max_connections
+        self.breaker = breaker
+        self.transport = transport
+        self._client = None
+
+    def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 3.0)),
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+                transport=self.transport
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def fetch_session(self, session_id: str) -> Optional[dict]:
+        """Session data for session_id, or None if the provider rejects it."""
+        if not self.breaker.allow():
+            raise self._unavailable()
+        http = self.start()
+        for attempt in range(self.retries + 1):
+            try:
+                auth_response = await http.get(self.url, headers={"X-Session-ID": session_id})
+                if auth_response.status_code != 429 and auth_response.status_code < 500:
+                    self.breaker.record_success()
+                    return auth_response.json() if auth_response.status_code == 200 else None
+                logger.warning(f"Auth provider answered {auth_response.status_code} (attempt {attempt + 1})")
+            except (httpx.TransportError, ValueError) as e:
+                # ValueError: a 200 whose body is not JSON
+                logger.warning(f"Auth provider request failed (attempt {attempt + 1}): {e!r}")
+            if attempt < self.retries:
+                await asyncio.sleep(random.uniform(0, AUTH_PROVIDER_BACKOFF_SECONDS * 2 ** attempt))
+        self.breaker.record_failure()
+        raise self._unavailable()
+
+    def _unavailable(self) -> HTTPException:
+        return HTTPException(
+            status_code=503,
+            detail="Auth provider unavailable",
+            headers={"Retry-After": str(self.breaker.retry_after() or 1)}
+        )
+
+auth_provider = AuthProviderClient(
+    AUTH_PROVIDER_URL,
+    AUTH_PROVIDER_TIMEOUT_SECONDS,
+    AUTH_PROVIDER_RETRIES,
+    AUTH_PROVIDER_MAX_CONNECTIONS,
+    CircuitBreaker(AUTH_BREAKER_FAILURES, AUTH_BREAKER_RESET_SECONDS)
+)
+
+class SessionExchangeCache:
+    """Recently exchanged session ids -> the exchange's task.
+
+    AuthCallback can post the same one-time session id twice; the second
+    call awaits or reuses the first exchange instead of hitting the provider
+    and the database again. Failed exchanges are forgotten so they can be retried.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    async def run(self, session_id: str, exchange) -> dict:
+        now = time.monotonic()
+        while self._entries:
+            oldest_id, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) < self.max_entries:
+                break
+            del self._entries[oldest_id]
+        
+        entry = self._entries.get(session_id)
+        if entry is None:
+            task = asyncio.create_task(exchange(session_id))
+            entry = (now + self.ttl_seconds, task)
+            if self.ttl_seconds > 0:
+                self._entries[session_id] = entry
+        try:
+            return await asyncio.shield(entry[1])
+        except Exception:
+            if self._entries.get(session_id) is entry:
+                del self._entries[session_id]
+            raise
+
+    def clear(self):
+        self._entries.clear()
+
+session_exchanges = SessionExchangeCache(SESSION_EXCHANGE_CACHE_SECONDS)
+
 # ============ AUTH ROUTES ============
 
 @api_router.post("/auth/register")
 async def register(user_data: UserCreate):
-    # Check if user exists
-    existing = await db.users.find_one({"email": user_data.email})
-    if existing:
-        raise HTTPException(status_code=400, detail="البريد الإلكتروني مسجل مسبقاً")
-    
     user_id = f"user_{uuid.uuid4().hex[:12]}"
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await password_hasher.hash(user_data.password)
     
     user_doc = {
         "user_id": user_id,
@@ -185,10 +696,14 @@ async def register(user_data: UserCreate):
         "name": user_data.name,
         "password": hashed_password,
         "picture": None,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     }
     
-    await db.users.insert_one(user_doc)
+    # The unique email index rejects already registered addresses
+    try:
+        await db.users.insert_one(user_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="البريد الإلكتروني مسجل مسبقاً")
     
     token = create_jwt_token(user_id, user_data.email)
     
@@ -211,9 +726,18 @@ async def login(credentials: UserLogin):
     if not user.get("password"):
         raise HTTPException(status_code=401, detail="يرجى استخدام تسجيل الدخول عبر Google")
     
-    if not verify_password(credentials.password, user["password"]):
+    if not await password_hasher.verify(credentials.password, user["password"]):
         raise HTTPException(status_code=401, detail="بيانات الدخول غير صحيحة")
     
+    # Upgrade hashes created with an older cost factor
+    if password_needs_rehash(user["password"]):
+        new_hash = await password_hasher.hash(credentials.password)
+        await db.users.update_one(
+            {"user_id": user["user_id"], "password": user["password"]},
+            {"$set": {"password": new_hash}}
+        )
+        principal_cache.invalidate_user(user["user_id"])
+    
     token = create_jwt_token(user["user_id"], user["email"])
     
     return {
@@ -226,26 +750,10 @@ async def login(credentials: UserLogin):
         }
     }
 
-@api_router.post("/auth/session")
-async def exchange_session(request: Request, response: Response):
-    """Exchange Google OAuth session_id for session_token"""
-    body = await request.json()
-    session_id = body.get("session_id")
-    
-    if not session_id:
-        raise HTTPException(status_code=400, detail="Session ID required")
-    
-    # Call Emergent Auth to get session data
-    async with httpx.AsyncClient() as client_http:
-        auth_response = await client_http.get(
-            "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-            headers={"X-Session-ID": session_id}
-        )
-        
-        if auth_response.status_code != 200:
-            raise HTTPException(status_code=401, detail="Invalid session")
-        
-        session_data = auth_response.json()
+async def _exchange_session(session_id: str) -> dict:
+    session_data = await auth_provider.fetch_session(session_id)
+    if session_data is None:
+        raise HTTPException(status_code=401, detail="Invalid session")
     
     email = session_data.get("email")
     name = session_data.get("name")
@@ -262,6 +770,7 @@ async def exchange_session(request: Request, response: Response):
             {"email": email},
             {"$set": {"name": name, "picture": picture}}
         )
+        principal_cache.invalidate_user(user_id)
     else:
         user_id = f"user_{uuid.uuid4().hex[:12]}"
         user_doc = {
@@ -269,7 +778,7 @@ async def exchange_session(request: Request, response: Response):
             "email": email,
             "name": name,
             "picture": picture,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         }
         await db.users.insert_one(user_doc)
     
@@ -278,14 +787,35 @@ async def exchange_session(request: Request, response: Response):
     await db.user_sessions.insert_one({
         "user_id": user_id,
         "session_token": session_token,
-        "expires_at": expires_at.isoformat(),
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "expires_at": expires_at,
+        "created_at": datetime.now(timezone.utc)
     })
     
+    return {
+        "session_token": session_token,
+        "user": {
+            "user_id": user_id,
+            "email": email,
+            "name": name,
+            "picture": picture
+        }
+    }
+
+@api_router.post("/auth/session")
+async def exchange_session(request: Request, response: Response):
+    """Exchange Google OAuth session_id for session_token"""
+    body = await request.json()
+    session_id = body.get("session_id")
+    
+    if not session_id:
+        raise HTTPException(status_code=400, detail="Session ID required")
+    
+    exchanged = await session_exchanges.run(session_id, _exchange_session)
+    
     # Set cookie
     response.set_cookie(
         key="session_token",
-        value=session_token,
+        value=exchanged["session_token"],
         httponly=True,
         secure=True,
         samesite="none",
@@ -293,12 +823,7 @@ async def exchange_session(request: Request, response: Response):
         max_age=7 * 24 * 60 * 60
     )
     
-    return {
-        "user_id": user_id,
-        "email": email,
-        "name": name,
-        "picture": picture
-    }
+    return exchanged["user"]
 
 @api_router.get("/auth/me")
 async def get_me(user: dict = Depends(get_current_user)):
@@ -314,62 +839,332 @@ async def logout(request: Request, response: Response):
     session_token = request.cookies.get("session_token")
     if session_token:
         await db.user_sessions.delete_one({"session_token": session_token})
+        principal_cache.invalidate(("session", session_token))
     
     response.delete_cookie(key="session_token", path="/")
     return {"message": "Logged out successfully"}
 
+# ============ CHANGE VERSIONS ============
+
+@asynccontextmanager
+async def change_version(user_id: str):
+    """Reserve the user's next change version for the writes in the block.
+
+    Every list/item write and every tombstone is stamped with a version so
+    /sync can return only what changed after the client's last version. The
+    reservation stays pending until the block exits, so versions handed to
+    clients never run ahead of a write that has not landed yet.
+    """
+    token = uuid.uuid4().hex
+    counter = await db.change_counters.find_one_and_update(
+        {"_id": user_id},
+        {"$inc": {"version": 1}, "$push": {"pending": {"token": token, "at": datetime.now(timezone.utc)}}},
+        projection={"version": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    version = counter["version"]
+    try:
+        yield version
+    finally:
+        # Shielded so a cancelled request still releases its reservation
+        await asyncio.shield(_release_change_version(user_id, token, version))
+
+async def _release_change_version(user_id: str, token: str, version: int):
+    # The last pending writer also publishes its version as committed
+    result = await db.change_counters.update_one(
+        {"_id": user_id, "pending": {"$size": 1}, "pending.token": token},
+        {"$set": {"pending": []}, "$max": {"committed": version}}
+    )
+    if result.matched_count == 0:
+        await db.change_counters.update_one({"_id": user_id}, {"$pull": {"pending": {"token": token}}})
+
+async def current_change_version(user_id: str) -> int:
+    """Highest version all of whose writes have landed.
+
+    With writes in flight that is the version committed when the pending set
+    last emptied; it may lag, so a client can be sent a change twice, but a
+    client resuming from it never misses one.
+    """
+    counter = await db.change_counters.find_one({"_id": user_id})
+    if not counter:
+        return 0
+    pending = counter.get("pending") or []
+    if not pending:
+        return counter["version"]
+    # Reservations a crashed worker never released stop counting eventually
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=CHANGE_RESERVATION_TIMEOUT_SECONDS)
+    if all(_as_utc(entry["at"]) < cutoff for entry in pending):
+        await db.change_counters.update_one({"_id": user_id}, {"$pull": {"pending": {"at": {"$lt": cutoff}}}})
+        return counter["version"]
+    return counter.get("committed", 0)
+
+def _as_utc(value: datetime) -> datetime:
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+async def tombstoned_ids(user_id: str, ids: List[str], since: int) -> set:
+    """Those of `ids` deleted after change version `since`."""
+    deleted = set()
+    for batch in _chunks(ids, SYNC_BATCH_SIZE):
+        deleted.update([
+            doc["id"] async for doc in db.tombstones.find(
+                {"user_id": user_id, "id": {"$in": batch}, "version": {"$gt": since}},
+                {"_id": 0, "id": 1}
+            )
+        ])
+    return deleted
+
+async def record_tombstones(user_id: str, kind: str, docs: List[dict], version: int):
+    """Remember deleted lists/items so delta syncs can remove them on clients.
+
+    Deleting a list records only the list; clients drop its items with it.
+    """
+    if not docs:
+        return
+    now = datetime.now(timezone.utc)
+    await db.tombstones.insert_many([
+        {
+            "user_id": user_id,
+            "kind": kind,
+            "id": doc["id"],
+            "list_id": doc.get("list_id"),
+            "version": version,
+            "deleted_at": now
+        }
+        for doc in docs
+    ])
+
+# ============ PAGINATION ============
+
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(*values) -> str:
+    """Opaque keyset cursor over the sort key of the last returned row."""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, *parsers) -> list:
+    """The cursor's values, each passed through its parser; 400 if any fails.
+
+    Cursors come from clients, so nothing in one may reach a query unchecked.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(parsers):
+            raise ValueError("wrong cursor shape")
+        return [parse(value) for parse, value in zip(parsers, values)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def cursor_string(value) -> str:
+    if not isinstance(value, str):
+        raise TypeError("expected a string")
+    return value
+
+def cursor_number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise TypeError("expected a number")
+    return value
+
+def cursor_datetime(value) -> datetime:
+    return datetime.fromisoformat(cursor_string(value))
+
+def check_page_limit(limit: Optional[int]):
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+# ============ CONDITIONAL GETS ============
+
+# Reads carry a strong ETag. GET /lists builds it from the committed change
+# version, so a client that already has the current page gets 304 before
+# any documents are fetched. A list's items are one indexed query either
+# way, so their tag hashes the encoded page and can never describe other
+# items than the ones sent. no-cache lets browsers and the service worker
+# keep the body but revalidate on every use.
+CACHE_CONTROL = "private, no-cache"
+
+def make_etag(*parts) -> str:
+    raw = "|".join("" if part is None else str(part) for part in parts)
+    return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20] + '"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    # Weak comparison, as If-None-Match requires
+    return etag in candidates or "W/" + etag in candidates
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+def set_cache_headers(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
+# ============ FAST JSON RESPONSES ============
+
+# Documents read from Mongo were validated when they were written, so hot
+# read paths project exactly the response model's fields and encode them
+# directly. FAST_JSON_RESPONSES=false restores response_model validation.
+
+def model_projection(model) -> dict:
+    return {"_id": 0, **{name: 1 for name in model.model_fields}}
+
+def _model_defaults(model) -> List[tuple]:
+    return [(name, field.default) for name, field in model.model_fields.items() if not field.is_required()]
+
+LIST_PROJECTION = model_projection(ShoppingList)
+ITEM_PROJECTION = model_projection(Item)
+_LIST_DEFAULTS = _model_defaults(ShoppingList)
+_ITEM_DEFAULTS = _model_defaults(Item)
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def json_bytes(content) -> bytes:
+    if orjson is not None:
+        # Z suffix matches what Pydantic emits for UTC datetimes
+        return orjson.dumps(content, default=_json_default, option=orjson.OPT_UTC_Z | orjson.OPT_NAIVE_UTC)
+    return json.dumps(content, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def fill_defaults(docs: List[dict], defaults: List[tuple]) -> List[dict]:
+    """Add model defaults for fields that older documents lack."""
+    for doc in docs:
+        for name, default in defaults:
+            if name not in doc:
+                doc[name] = default
+    return docs
+
+def fast_json_response(content, response: Response) -> Response:
+    """Encode content directly, keeping headers set on the injected response."""
+    return Response(json_bytes(content), media_type="application/json", headers=dict(response.headers))
+
 # ============ SHOPPING LIST ROUTES ============
 
-@api_router.get("/lists", response_model=List[ShoppingList])
-async def get_lists(user: dict = Depends(get_current_user)):
+async def list_stats(list_ids: List[str]) -> dict:
+    """list_id -> total/done/per-category item counts, from one aggregation."""
+    stats = {list_id: {"total": 0, "done": 0, "categories": []} for list_id in list_ids}
+    if not list_ids:
+        return stats
+    pipeline = [
+        {"$match": {"list_id": {"$in": list_ids}}},
+        {"$group": {
+            "_id": {"list_id": "$list_id", "category": "$category"},
+            "total": {"$sum": 1},
+            "done": {"$sum": {"$cond": [{"$eq": ["$is_done", True]}, 1, 0]}}
+        }}
+    ]
+    async for group in db.items.aggregate(pipeline):
+        summary = stats[group["_id"]["list_id"]]
+        summary["total"] += group["total"]
+        summary["done"] += group["done"]
+        summary["categories"].append({
+            "category": group["_id"].get("category"),
+            "total": group["total"],
+            "done": group["done"]
+        })
+    for summary in stats.values():
+        summary["categories"].sort(key=lambda category: (-category["total"], category["category"] or ""))
+    return stats
+
+@api_router.get("/lists", response_model=Union[List[ShoppingListSummary], ShoppingListSummaryPage, List[ShoppingList], ShoppingListPage])
+async def get_lists(request: Request, response: Response, limit: Optional[int] = None, cursor: Optional[str] = None, include: Optional[str] = None, user: dict = Depends(get_current_user)):
+    """Lists by most recently updated.
+
+    Passing `limit` (and then `cursor`) switches to a keyset-paginated
+    {"lists", "limit", "next_cursor"} envelope. `include=stats` adds each
+    list's total, done and per-category item counts.
+    """
+    check_page_limit(limit)
+    includes = set(include.split(",")) if include else set()
+    if includes - {"stats"}:
+        raise HTTPException(status_code=400, detail="include must be 'stats'")
+    with_stats = "stats" in includes
+    
+    # Any list or item write bumps the user's change version, so it versions
+    # the whole page, stats included. The committed version is read before
+    # the lists, so the page is never older than its tag.
+    tag = make_etag("lists", await current_change_version(user["user_id"]), limit, cursor, with_stats)
+    if etag_matches(request, tag):
+        return not_modified(tag)
+    
+    query = {"user_id": user["user_id"]}
+    if cursor:
+        updated_at, last_id = decode_cursor(cursor, cursor_datetime, cursor_string)
+        query["$or"] = [
+            {"updated_at": {"$lt": updated_at}},
+            {"updated_at": updated_at, "id": {"$lt": last_id}}
+        ]
+    
+    paginated = limit is not None or cursor is not None
+    page_size = limit or 100
     lists = await db.shopping_lists.find(
-        {"user_id": user["user_id"]},
-        {"_id": 0}
-    ).sort("updated_at", -1).to_list(100)
-    
-    for lst in lists:
-        if isinstance(lst.get('created_at'), str):
-            lst['created_at'] = datetime.fromisoformat(lst['created_at'])
-        if isinstance(lst.get('updated_at'), str):
-            lst['updated_at'] = datetime.fromisoformat(lst['updated_at'])
-    
-    return lists
+        query,
+        LIST_PROJECTION
+    ).sort([("updated_at", -1), ("id", -1)]).to_list(page_size + 1 if paginated else page_size)
+    set_cache_headers(response, tag)
+    
+    next_cursor = None
+    if paginated and len(lists) > page_size:
+        lists = lists[:page_size]
+        next_cursor = encode_cursor(lists[-1]["updated_at"], lists[-1]["id"])
+    
+    if with_stats:
+        stats = await list_stats([lst["id"] for lst in lists])
+        for lst in lists:
+            lst["stats"] = stats[lst["id"]]
+    
+    content = {"lists": lists, "limit": page_size, "next_cursor": next_cursor} if paginated else lists
+    if FAST_JSON_RESPONSES:
+        fill_defaults(lists, _LIST_DEFAULTS)
+        return fast_json_response(content, response)
+    return content
 
 @api_router.post("/lists", response_model=ShoppingList)
 async def create_list(list_data: ShoppingListCreate, user: dict = Depends(get_current_user)):
     now = datetime.now(timezone.utc)
     list_id = f"list_{uuid.uuid4().hex[:12]}"
     
-    list_doc = {
-        "id": list_id,
-        "user_id": user["user_id"],
-        "name": list_data.name,
-        "created_at": now.isoformat(),
-        "updated_at": now.isoformat()
-    }
-    
-    await db.shopping_lists.insert_one(list_doc)
-    
-    list_doc['created_at'] = now
-    list_doc['updated_at'] = now
+    async with change_version(user["user_id"]) as version:
+        list_doc = {
+            "id": list_id,
+            "user_id": user["user_id"],
+            "name": list_data.name,
+            "version": version,
+            "next_order": 0,
+            "created_at": now,
+            "updated_at": now,
+            **list_search_fields(list_data.name)
+        }
+        
+        await db.shopping_lists.insert_one(list_doc)
+    publish_change(user["user_id"], "list.upserted", list_id, version)
     
     return ShoppingList(**list_doc)
 
 @api_router.get("/lists/{list_id}", response_model=ShoppingList)
-async def get_list(list_id: str, user: dict = Depends(get_current_user)):
+async def get_list(list_id: str, request: Request, response: Response, user: dict = Depends(get_current_user)):
     lst = await db.shopping_lists.find_one(
         {"id": list_id, "user_id": user["user_id"]},
-        {"_id": 0}
+        LIST_PROJECTION
     )
     
     if not lst:
         raise HTTPException(status_code=404, detail="القائمة غير موجودة")
     
-    if isinstance(lst.get('created_at'), str):
-        lst['created_at'] = datetime.fromisoformat(lst['created_at'])
-    if isinstance(lst.get('updated_at'), str):
-        lst['updated_at'] = datetime.fromisoformat(lst['updated_at'])
+    tag = make_etag("list", list_id, lst.get("version"), lst.get("updated_at"), lst.get("name"))
+    if etag_matches(request, tag):
+        return not_modified(tag)
+    set_cache_headers(response, tag)
     
+    if FAST_JSON_RESPONSES:
+        return fast_json_response(fill_defaults([lst], _LIST_DEFAULTS)[0], response)
     return ShoppingList(**lst)
 
 @api_router.put("/lists/{list_id}", response_model=ShoppingList)
@@ -385,19 +1180,19 @@ async def update_list(list_id: str, list_data: ShoppingListUpdate, user: dict =
     update_data = {}
     if list_data.name is not None:
         update_data["name"] = list_data.name
+        update_data.update(list_search_fields(list_data.name))
     
-    update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
+    update_data["updated_at"] = datetime.now(timezone.utc)
     
-    await db.shopping_lists.update_one(
-        {"id": list_id},
-        {"$set": update_data}
-    )
+    async with change_version(user["user_id"]) as version:
+        update_data["version"] = version
+        await db.shopping_lists.update_one(
+            {"id": list_id},
+            {"$set": update_data}
+        )
     
     updated = await db.shopping_lists.find_one({"id": list_id}, {"_id": 0})
-    if isinstance(updated.get('created_at'), str):
-        updated['created_at'] = datetime.fromisoformat(updated['created_at'])
-    if isinstance(updated.get('updated_at'), str):
-        updated['updated_at'] = datetime.fromisoformat(updated['updated_at'])
+    publish_change(user["user_id"], "list.upserted", list_id, update_data["version"])
     
     return ShoppingList(**updated)
 
@@ -415,285 +1210,987 @@ async def delete_list(list_id: str, user: dict = Depends(get_current_user)):
     # Delete the list
     await db.shopping_lists.delete_one({"id": list_id})
     
+    async with change_version(user["user_id"]) as version:
+        await record_tombstones(user["user_id"], "list", [lst], version)
+    publish_change(user["user_id"], "list.deleted", list_id, version)
+    
     return {"message": "تم حذف القائمة بنجاح"}
 
 # ============ ITEM ROUTES ============
 
-@api_router.get("/lists/{list_id}/items", response_model=List[Item])
-async def get_items(list_id: str, user: dict = Depends(get_current_user)):
-    # Verify list ownership
-    lst = await db.shopping_lists.find_one(
-        {"id": list_id, "user_id": user["user_id"]}
+# Items carry their owner's user_id, so one filtered write both authorises
+# and performs an item mutation. The list bump is filtered by owner as well
+# and tells a missing list apart from a missing item. Creates take their
+# order in the same write as the bump. Item ETags hash the items returned,
+# so a read between the bump and the item write cannot be cached as new.
+
+async def touch_list(list_id: str, user_id: str, now: datetime, version: int, min_next_order: Optional[int] = None) -> bool:
+    """Bump a list's updated_at/version; False if the user owns no such list.
+
+    Both only move forward, whichever of two concurrent bumps lands last.
+    min_next_order keeps the list's order counter past an explicitly set order.
+    """
+    update = {"$max": {"updated_at": now, "version": version}}
+    if min_next_order is not None:
+        update["$max"]["next_order"] = min_next_order
+    result = await db.shopping_lists.update_one(
+        {"id": list_id, "user_id": user_id},
+        update
     )
-    if not lst:
-        raise HTTPException(status_code=404, detail="القائمة غير موجودة")
-    
-    items = await db.items.find({"list_id": list_id}, {"_id": 0}).sort("order", 1).to_list(500)
-    
-    for item in items:
-        if isinstance(item.get('created_at'), str):
-            item['created_at'] = datetime.fromisoformat(item['created_at'])
-        if isinstance(item.get('updated_at'), str):
-            item['updated_at'] = datetime.fromisoformat(item['updated_at'])
-    
-    return items
+    return result.matched_count > 0
 
-@api_router.post("/lists/{list_id}/items", response_model=Item)
-async def create_item(list_id: str, item_data: ItemCreate, user: dict = Depends(get_current_user)):
-    # Verify list ownership
-    lst = await db.shopping_lists.find_one(
-        {"id": list_id, "user_id": user["user_id"]}
+async def allocate_item_order(list_id: str, user_id: str, now: datetime, version: int, count: int = 1) -> Optional[int]:
+    """Take the next `count` item orders and bump the list, in one write.
+
+    Returns the first order, or None if the user owns no such list.
+    """
+    before = await db.shopping_lists.find_one_and_update(
+        {"id": list_id, "user_id": user_id},
+        {"$inc": {"next_order": count}, "$max": {"updated_at": now, "version": version}},
+        projection={"_id": 0, "id": 1, "next_order": 1},
+        return_document=ReturnDocument.BEFORE
     )
-    if not lst:
-        raise HTTPException(status_code=404, detail="القائمة غير موجودة")
-    
-    # Get max order
+    if before is None:
+        return None
+    if "next_order" in before:
+        return before["next_order"]
+    return await seed_next_order(list_id, count)
+
+async def seed_next_order(list_id: str, reserve: int) -> int:
+    """Seed the counter of a list that predates it (migration 5 not there yet).
+
+    Returns the first of `reserve` orders after the list's highest item.
+    """
     max_order_item = await db.items.find_one(
         {"list_id": list_id},
+        {"_id": 0, "order": 1},
         sort=[("order", -1)]
     )
     next_order = (max_order_item.get("order", 0) + 1) if max_order_item else 0
-    
-    now = datetime.now(timezone.utc)
-    item_id = f"item_{uuid.uuid4().hex[:12]}"
-    
-    item_doc = {
-        "id": item_id,
-        "list_id": list_id,
-        "name": item_data.name,
-        "quantity": item_data.quantity,
-        "unit": item_data.unit,
-        "category": item_data.category,
-        "note": item_data.note,
-        "is_done": False,
-        "priority": item_data.priority,
-        "order": next_order,
-        "created_at": now.isoformat(),
-        "updated_at": now.isoformat()
-    }
-    
-    await db.items.insert_one(item_doc)
-    
-    # Update list timestamp
     await db.shopping_lists.update_one(
         {"id": list_id},
-        {"$set": {"updated_at": now.isoformat()}}
+        {"$max": {"next_order": next_order + reserve}}
+    )
+    return next_order
+
+async def backfill_item_owner(list_id: str, user_id: str) -> bool:
+    """Stamp user_id on items of an owned list that predate the field.
+
+    Covers the window before migration 4 has reached this list; returns
+    True if anything changed and the caller should retry its query. Once
+    the migration is recorded it is a no-op without a round trip.
+    """
+    if await migration_status.applied(4):
+        return False
+    result = await db.items.update_many(
+        {"list_id": list_id, "user_id": {"$exists": False}},
+        {"$set": {"user_id": user_id}}
     )
+    return result.modified_count > 0
+
+async def bump_next_orders(next_orders: dict):
+    """Raise list order counters past orders written by sync/import."""
+    ops = [
+        UpdateOne({"id": list_id}, {"$max": {"next_order": next_order}})
+        for list_id, next_order in next_orders.items()
+    ]
+    for batch in _chunks(ops, SYNC_BATCH_SIZE):
+        await db.shopping_lists.bulk_write(batch, ordered=False)
+
+async def list_exists(list_id: str, user_id: str) -> bool:
+    return await db.shopping_lists.count_documents({"id": list_id, "user_id": user_id}, limit=1) > 0
+
+@api_router.get("/lists/{list_id}/items", response_model=Union[List[Item], ItemPage])
+async def get_items(list_id: str, request: Request, response: Response, limit: Optional[int] = None, cursor: Optional[str] = None, user: dict = Depends(get_current_user)):
+    """Items in list order; `limit`/`cursor` paginate like GET /lists."""
+    check_page_limit(limit)
+    
+    query = {"list_id": list_id, "user_id": user["user_id"]}
+    if cursor:
+        order, last_id = decode_cursor(cursor, cursor_number, cursor_string)
+        query["$or"] = [
+            {"order": {"$gt": order}},
+            {"order": order, "id": {"$gt": last_id}}
+        ]
+    
+    paginated = limit is not None or cursor is not None
+    page_size = limit or 500
+    
+    async def fetch():
+        return await db.items.find(
+            query,
+            ITEM_PROJECTION
+        ).sort([("order", 1), ("id", 1)]).to_list(page_size + 1 if paginated else page_size)
+    
+    # Items are filtered by owner, so only an empty page needs the list
+    # looked up to tell an empty list from someone else's
+    items = await fetch()
+    if not items:
+        if not await list_exists(list_id, user["user_id"]):
+            raise HTTPException(status_code=404, detail="القائمة غير موجودة")
+        if await backfill_item_owner(list_id, user["user_id"]):
+            items = await fetch()
+    
+    next_cursor = None
+    if paginated and len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = encode_cursor(items[-1]["order"], items[-1]["id"])
+    
+    content = {"items": items, "limit": page_size, "next_cursor": next_cursor} if paginated else items
+    fill_defaults(items, _ITEM_DEFAULTS)
+    body = json_bytes(content)
+    tag = make_etag("items", hashlib.sha1(body).hexdigest())
+    if etag_matches(request, tag):
+        return not_modified(tag)
+    set_cache_headers(response, tag)
+    if FAST_JSON_RESPONSES:
+        return Response(body, media_type="application/json", headers=dict(response.headers))
+    return content
+
+@api_router.post("/lists/{list_id}/items", response_model=Item)
+async def create_item(list_id: str, item_data: ItemCreate, user: dict = Depends(get_current_user)):
+    now = datetime.now(timezone.utc)
+    item_id = f"item_{uuid.uuid4().hex[:12]}"
     
-    item_doc['created_at'] = now
-    item_doc['updated_at'] = now
+    async with change_version(user["user_id"]) as version:
+        # Taking the next order also verifies list ownership
+        next_order = await allocate_item_order(list_id, user["user_id"], now, version)
+        if next_order is None:
+            raise HTTPException(status_code=404, detail="القائمة غير موجودة")
+        
+        item_doc = {
+            "id": item_id,
+            "list_id": list_id,
+            "user_id": user["user_id"],
+            "name": item_data.name,
+            "quantity": item_data.quantity,
+            "unit": item_data.unit,
+            "category": item_data.category,
+            "note": item_data.note,
+            "is_done": False,
+            "priority": item_data.priority,
+            "order": next_order,
+            "version": version,
+            "created_at": now,
+            "updated_at": now
+        }
+        item_doc.update(item_search_fields(item_doc))
+        
+        await db.items.insert_one(item_doc)
+    suggestion_index.record(user["user_id"], [item_doc])
+    publish_change(user["user_id"], "items.changed", list_id, version, item_ids=[item_id], deleted_ids=[])
     
     return Item(**item_doc)
 
+@api_router.post("/lists/{list_id}/items/batch")
+async def batch_items(list_id: str, batch: ItemBatchRequest, user: dict = Depends(get_current_user)):
+    """Apply an ordered array of create/update/delete operations to one list.
+
+    One ownership check (which also reserves the orders for every create
+    and bumps the list), one read of the targeted items and one bulk_write.
+    """
+    operations = batch.operations
+    now = datetime.now(timezone.utc)
+    creates = sum(1 for operation in operations if operation.op == "create")
+    
+    async with change_version(user["user_id"]) as version:
+        next_order = await allocate_item_order(list_id, user["user_id"], now, version, creates)
+        if next_order is None:
+            raise HTTPException(status_code=404, detail="القائمة غير موجودة")
+        
+        target_ids = list({operation.id for operation in operations if operation.op != "create"})
+        
+        async def fetch_targets():
+            return {
+                item["id"]: item async for item in db.items.find(
+                    {"id": {"$in": target_ids}, "list_id": list_id, "user_id": user["user_id"]},
+                    {"_id": 0}
+                )
+            }
+        
+        items = await fetch_targets() if target_ids else {}
+        if len(items) < len(target_ids) and await backfill_item_owner(list_id, user["user_id"]):
+            items = await fetch_targets()
+        
+        # Replay the operations in order against the fetched documents so each
+        # one gets its own result without a read per operation
+        write_ops = []
+        results = []
+        created = []
+        deleted = []
+        max_order = next_order + creates - 1
+        for operation in operations:
+            if operation.op == "create":
+                item_doc = {
+                    "id": f"item_{uuid.uuid4().hex[:12]}",
+                    "list_id": list_id,
+                    "user_id": user["user_id"],
+                    "name": operation.data.name,
+                    "quantity": operation.data.quantity,
+                    "unit": operation.data.unit,
+                    "category": operation.data.category,
+                    "note": operation.data.note,
+                    "is_done": bool(operation.data.is_done),
+                    "priority": operation.data.priority,
+                    "order": next_order,
+                    "version": version,
+                    "created_at": now,
+                    "updated_at": now
+                }
+                item_doc.update(item_search_fields(item_doc))
+                next_order += 1
+                items[item_doc["id"]] = item_doc
+                created.append(item_doc)
+                write_ops.append(InsertOne(dict(item_doc)))
+                results.append({"op": "create", "id": item_doc["id"], "status": "created"})
+                continue
+            
+            item = items.get(operation.id)
+            if item is None:
+                results.append({"op": operation.op, "id": operation.id, "status": "not_found"})
+                continue
+            
+            if operation.op == "delete":
+                del items[operation.id]
+                deleted.append({"id": operation.id, "list_id": list_id})
+                write_ops.append(DeleteOne({"id": operation.id, "list_id": list_id, "user_id": user["user_id"]}))
+                results.append({"op": "delete", "id": operation.id, "status": "deleted"})
+                continue
+            
+            update_data = {"updated_at": now, "version": version}
+            if operation.data is not None:
+                for field in ['name', 'quantity', 'unit', 'category', 'note', 'is_done', 'priority', 'order']:
+                    value = getattr(operation.data, field, None)
+                    if value is not None:
+                        update_data[field] = value
+            if "order" in update_data:
+                max_order = max(max_order, update_data["order"])
+            item.update(update_data)
+            if any(field in update_data for field in ITEM_SEARCH_SOURCES):
+                update_data.update(item_search_fields(item))
+            write_ops.append(UpdateOne(
+                {"id": operation.id, "list_id": list_id, "user_id": user["user_id"]},
+                {"$set": update_data}
+            ))
+            results.append({"op": "update", "id": operation.id, "status": "updated"})
+        
+        if write_ops:
+            await db.items.bulk_write(write_ops, ordered=True)
+            suggestion_index.record(user["user_id"], created)
+        if deleted:
+            await record_tombstones(user["user_id"], "item", deleted, version)
+        if max_order + 1 > next_order:
+            # An update set an order past the ones reserved above
+            await touch_list(list_id, user["user_id"], now, version, max_order + 1)
+    
+    touched = {result["id"] for result in results if result["status"] in ("created", "updated")}
+    if write_ops:
+        publish_change(
+            user["user_id"], "items.changed", list_id, version,
+            item_ids=sorted(item_id for item_id in touched if item_id in items),
+            deleted_ids=[doc["id"] for doc in deleted]
+        )
+    resulting = sorted((items[item_id] for item_id in touched if item_id in items), key=lambda item: item.get("order", 0))
+    return {
+        "results": results,
+        "items": [Item(**item) for item in resulting]
+    }
+
 @api_router.put("/lists/{list_id}/items/{item_id}", response_model=Item)
 async def update_item(list_id: str, item_id: str, item_data: ItemUpdate, user: dict = Depends(get_current_user)):
-    # Verify list ownership
-    lst = await db.shopping_lists.find_one(
-        {"id": list_id, "user_id": user["user_id"]}
-    )
-    if not lst:
-        raise HTTPException(status_code=404, detail="القائمة غير موجودة")
-    
-    item = await db.items.find_one({"id": item_id, "list_id": list_id}, {"_id": 0})
-    if not item:
-        raise HTTPException(status_code=404, detail="العنصر غير موجود")
-    
     update_data = {}
     for field in ['name', 'quantity', 'unit', 'category', 'note', 'is_done', 'priority', 'order']:
         value = getattr(item_data, field, None)
         if value is not None:
             update_data[field] = value
     
-    update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
-    
-    await db.items.update_one({"id": item_id}, {"$set": update_data})
-    
-    # Update list timestamp
-    await db.shopping_lists.update_one(
-        {"id": list_id},
-        {"$set": {"updated_at": datetime.now(timezone.utc).isoformat()}}
-    )
+    now = datetime.now(timezone.utc)
+    update_data["updated_at"] = now
+    
+    async def apply():
+        return await db.items.find_one_and_update(
+            {"id": item_id, "list_id": list_id, "user_id": user["user_id"]},
+            {"$set": update_data},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
     
-    updated = await db.items.find_one({"id": item_id}, {"_id": 0})
-    if isinstance(updated.get('created_at'), str):
-        updated['created_at'] = datetime.fromisoformat(updated['created_at'])
-    if isinstance(updated.get('updated_at'), str):
-        updated['updated_at'] = datetime.fromisoformat(updated['updated_at'])
+    min_next_order = update_data["order"] + 1 if "order" in update_data else None
+    async with change_version(user["user_id"]) as version:
+        update_data["version"] = version
+        updated = await apply()
+        if updated is None:
+            if not await list_exists(list_id, user["user_id"]):
+                raise HTTPException(status_code=404, detail="القائمة غير موجودة")
+            if await backfill_item_owner(list_id, user["user_id"]):
+                updated = await apply()
+        if updated is None:
+            raise HTTPException(status_code=404, detail="العنصر غير موجود")
+        if any(field in update_data for field in ITEM_SEARCH_SOURCES):
+            await db.items.bulk_write(item_search_updates([updated]))
+        await touch_list(list_id, user["user_id"], now, version, min_next_order)
+    publish_change(user["user_id"], "items.changed", list_id, update_data["version"], item_ids=[item_id], deleted_ids=[])
     
     return Item(**updated)
 
 @api_router.delete("/lists/{list_id}/items/{item_id}")
 async def delete_item(list_id: str, item_id: str, user: dict = Depends(get_current_user)):
-    # Verify list ownership
-    lst = await db.shopping_lists.find_one(
-        {"id": list_id, "user_id": user["user_id"]}
-    )
-    if not lst:
-        raise HTTPException(status_code=404, detail="القائمة غير موجودة")
-    
-    result = await db.items.delete_one({"id": item_id, "list_id": list_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="العنصر غير موجود")
+    now = datetime.now(timezone.utc)
     
-    # Update list timestamp
-    await db.shopping_lists.update_one(
-        {"id": list_id},
-        {"$set": {"updated_at": datetime.now(timezone.utc).isoformat()}}
-    )
+    async def apply():
+        return await db.items.delete_one({"id": item_id, "list_id": list_id, "user_id": user["user_id"]})
+    
+    async with change_version(user["user_id"]) as version:
+        result = await apply()
+        if result.deleted_count == 0:
+            if not await list_exists(list_id, user["user_id"]):
+                raise HTTPException(status_code=404, detail="القائمة غير موجودة")
+            if await backfill_item_owner(list_id, user["user_id"]):
+                result = await apply()
+        if result.deleted_count == 0:
+            raise HTTPException(status_code=404, detail="العنصر غير موجود")
+        
+        await record_tombstones(user["user_id"], "item", [{"id": item_id, "list_id": list_id}], version)
+        await touch_list(list_id, user["user_id"], now, version)
+    publish_change(user["user_id"], "items.changed", list_id, version, item_ids=[], deleted_ids=[item_id])
     
     return {"message": "تم حذف العنصر بنجاح"}
 
+# ============ REORDERING ============
+
+# A move sets the item's order to the midpoint of its new neighbours, so it
+# writes one item however long the list is. When a move leaves the gap too
+# small, the list is renumbered in the background; when neighbours have no
+# room between them at all, it is renumbered before the move.
+MIN_ORDER_GAP = 1e-6
+
+_rebalance_tasks = {}
+
+def schedule_rebalance(list_id: str, user_id: str):
+    if list_id in _rebalance_tasks:
+        return
+    task = asyncio.create_task(rebalance_item_orders(list_id, user_id))
+    _rebalance_tasks[list_id] = task
+    task.add_done_callback(lambda _: _rebalance_tasks.pop(list_id, None))
+
+async def rebalance_item_orders(list_id: str, user_id: str):
+    """Renumber a list's items 0..n-1 in their current order."""
+    try:
+        items = await db.items.find(
+            {"list_id": list_id},
+            {"_id": 0, "id": 1, "order": 1}
+        ).sort([("order", 1), ("id", 1)]).to_list(None)
+        now = datetime.now(timezone.utc)
+        async with change_version(user_id) as version:
+            ops = [
+                UpdateOne({"id": item["id"], "order": item.get("order")}, {"$set": {"order": position, "version": version, "updated_at": now}})
+                for position, item in enumerate(items)
+                if item.get("order") != position
+            ]
+            for batch in _chunks(ops, SYNC_BATCH_SIZE):
+                await db.items.bulk_write(batch, ordered=False)
+            await db.shopping_lists.update_one(
+                {"id": list_id},
+                {"$max": {"version": version, "next_order": len(items)}}
+            )
+        publish_change(user_id, "items.changed", list_id, version, item_ids=None, deleted_ids=[])
+    except Exception:
+        logger.exception(f"Rebalancing item orders of {list_id} failed")
+
+@api_router.post("/lists/{list_id}/items/{item_id}/move", response_model=Item)
+async def move_item(list_id: str, item_id: str, move: ItemMove, user: dict = Depends(get_current_user)):
+    neighbour_ids = [i for i in (move.after_id, move.before_id) if i]
+    if not neighbour_ids or item_id in neighbour_ids:
+        raise HTTPException(status_code=400, detail="after_id or before_id required")
+    
+    async def fetch_neighbours():
+        return {
+            item["id"]: (item.get("order", 0), item["id"]) async for item in db.items.find(
+                {"id": {"$in": neighbour_ids}, "list_id": list_id, "user_id": user["user_id"]},
+                {"_id": 0, "id": 1, "order": 1}
+            )
+        }
+    
+    async def adjacent(position: tuple, direction: int) -> Optional[tuple]:
+        """(order, id) of the item next to `position` in list order, skipping the moved one."""
+        order, neighbour_id = position
+        op = "$gt" if direction > 0 else "$lt"
+        item = await db.items.find_one(
+            {
+                "list_id": list_id,
+                "user_id": user["user_id"],
+                "id": {"$ne": item_id},
+                "$or": [{"order": {op: order}}, {"order": order, "id": {op: neighbour_id}}]
+            },
+            {"_id": 0, "id": 1, "order": 1},
+            sort=[("order", direction), ("id", direction)]
+        )
+        return (item.get("order", 0), item["id"]) if item else None
+    
+    async def gap():
+        """The (after, before) positions the item goes between; None at either end."""
+        neighbours = await fetch_neighbours()
+        if len(neighbours) < len(neighbour_ids):
+            if not await list_exists(list_id, user["user_id"]):
+                raise HTTPException(status_code=404, detail="القائمة غير موجودة")
+            if await backfill_item_owner(list_id, user["user_id"]):
+                neighbours = await fetch_neighbours()
+        if len(neighbours) < len(neighbour_ids):
+            raise HTTPException(status_code=404, detail="العنصر غير موجود")
+        # With one neighbour given, the other is whichever item is next to it now
+        after = neighbours.get(move.after_id)
+        before = neighbours.get(move.before_id)
+        if before is None:
+            before = await adjacent(after, 1)
+        elif after is None:
+            after = await adjacent(before, -1)
+        elif before <= after:
+            raise HTTPException(status_code=400, detail="before_id must come after after_id")
+        return after, before
+    
+    after, before = await gap()
+    if after is not None and before is not None and before[0] - after[0] < MIN_ORDER_GAP:
+        # Equal or nearly equal orders leave no room between them
+        await rebalance_item_orders(list_id, user["user_id"])
+        after, before = await gap()
+    
+    needs_rebalance = False
+    if after is not None and before is not None:
+        new_order = (after[0] + before[0]) / 2
+        needs_rebalance = before[0] - after[0] < 2 * MIN_ORDER_GAP
+    elif after is not None:
+        new_order = math.floor(after[0]) + 1
+    else:
+        new_order = math.ceil(before[0]) - 1
+    
+    now = datetime.now(timezone.utc)
+    async with change_version(user["user_id"]) as version:
+        updated = await db.items.find_one_and_update(
+            {"id": item_id, "list_id": list_id, "user_id": user["user_id"]},
+            {"$set": {"order": new_order, "updated_at": now, "version": version}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if updated is None:
+            raise HTTPException(status_code=404, detail="العنصر غير موجود")
+        await touch_list(list_id, user["user_id"], now, version, math.floor(new_order) + 1)
+    
+    publish_change(user["user_id"], "items.changed", list_id, version, item_ids=[item_id], deleted_ids=[])
+    if needs_rebalance:
+        schedule_rebalance(list_id, user["user_id"])
+    
+    return Item(**updated)
+
 # ============ BULK ACTIONS ============
 
 @api_router.post("/lists/{list_id}/mark-all-done")
 async def mark_all_done(list_id: str, user: dict = Depends(get_current_user)):
-    lst = await db.shopping_lists.find_one(
-        {"id": list_id, "user_id": user["user_id"]}
-    )
-    if not lst:
-        raise HTTPException(status_code=404, detail="القائمة غير موجودة")
+    now = datetime.now(timezone.utc)
     
-    now = datetime.now(timezone.utc).isoformat()
-    await db.items.update_many(
-        {"list_id": list_id},
-        {"$set": {"is_done": True, "updated_at": now}}
-    )
+    async def apply():
+        return await db.items.update_many(
+            {"list_id": list_id, "user_id": user["user_id"], "is_done": {"$ne": True}},
+            {"$set": {"is_done": True, "updated_at": now, "version": version}}
+        )
     
-    await db.shopping_lists.update_one(
-        {"id": list_id},
-        {"$set": {"updated_at": now}}
-    )
+    async with change_version(user["user_id"]) as version:
+        result = await apply()
+        if result.matched_count == 0:
+            # Nothing left to mark, or no such list
+            if not await list_exists(list_id, user["user_id"]):
+                raise HTTPException(status_code=404, detail="القائمة غير موجودة")
+            if await backfill_item_owner(list_id, user["user_id"]):
+                result = await apply()
+        if result.matched_count:
+            await touch_list(list_id, user["user_id"], now, version)
+    if result.matched_count:
+        publish_change(user["user_id"], "items.changed", list_id, version, item_ids=None, deleted_ids=[])
     
     return {"message": "تم تحديد جميع العناصر كمشتراة"}
 
 @api_router.post("/lists/{list_id}/clear-done")
 async def clear_done(list_id: str, user: dict = Depends(get_current_user)):
-    lst = await db.shopping_lists.find_one(
-        {"id": list_id, "user_id": user["user_id"]}
-    )
-    if not lst:
-        raise HTTPException(status_code=404, detail="القائمة غير موجودة")
-    
-    await db.items.delete_many({"list_id": list_id, "is_done": True})
+    now = datetime.now(timezone.utc)
     
-    await db.shopping_lists.update_one(
-        {"id": list_id},
-        {"$set": {"updated_at": datetime.now(timezone.utc).isoformat()}}
-    )
+    async def fetch_done():
+        return await db.items.find(
+            {"list_id": list_id, "user_id": user["user_id"], "is_done": True},
+            {"_id": 0, "id": 1, "list_id": 1}
+        ).to_list(None)
+    
+    done_items = await fetch_done()
+    if not done_items:
+        # Nothing to clear, or no such list
+        if not await list_exists(list_id, user["user_id"]):
+            raise HTTPException(status_code=404, detail="القائمة غير موجودة")
+        if await backfill_item_owner(list_id, user["user_id"]):
+            done_items = await fetch_done()
+    if not done_items:
+        return {"message": "تم مسح العناصر المشتراة"}
+    
+    async with change_version(user["user_id"]) as version:
+        await db.items.delete_many({
+            "list_id": list_id,
+            "user_id": user["user_id"],
+            "id": {"$in": [item["id"] for item in done_items]}
+        })
+        await record_tombstones(user["user_id"], "item", done_items, version)
+        await touch_list(list_id, user["user_id"], now, version)
+    publish_change(user["user_id"], "items.changed", list_id, version, item_ids=[], deleted_ids=[item["id"] for item in done_items])
     
     return {"message": "تم مسح العناصر المشتراة"}
 
 # ============ EXPORT/IMPORT ============
 
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '500'))
+
+def _dumps(doc) -> str:
+    return json.dumps(doc, default=_json_default, ensure_ascii=False, separators=(",", ":"))
+
+async def _iter_export_docs(user_id: str):
+    """Yield ("list"|"item", batch) tuples straight from the cursors."""
+    list_ids = []
+    cursor = db.shopping_lists.find({"user_id": user_id}, PUBLIC_PROJECTION).batch_size(EXPORT_BATCH_SIZE)
+    batch = []
+    async for lst in cursor:
+        list_ids.append(lst["id"])
+        batch.append(lst)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield "list", batch
+            batch = []
+    if batch:
+        yield "list", batch
+    
+    cursor = db.items.find({"list_id": {"$in": list_ids}}, PUBLIC_PROJECTION).batch_size(EXPORT_BATCH_SIZE)
+    batch = []
+    async for item in cursor:
+        batch.append(item)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield "item", batch
+            batch = []
+    if batch:
+        yield "item", batch
+
+async def _export_json_chunks(user_id: str):
+    """Same shape as the old export body, emitted one batch at a time."""
+    yield '{"lists":['
+    current = "list"
+    first = True
+    async for kind, batch in _iter_export_docs(user_id):
+        if kind != current:
+            yield '],"items":['
+            current = kind
+            first = True
+        chunk = ",".join(_dumps(doc) for doc in batch)
+        yield chunk if first else "," + chunk
+        first = False
+    if current == "list":
+        yield '],"items":['
+    yield '],"exported_at":' + _dumps(datetime.now(timezone.utc).isoformat()) + '}'
+
+async def _export_ndjson_chunks(user_id: str):
+    async for kind, batch in _iter_export_docs(user_id):
+        yield "".join(_dumps({"type": kind, **doc}) + "\n" for doc in batch)
+    yield _dumps({"type": "meta", "exported_at": datetime.now(timezone.utc).isoformat()}) + "\n"
+
 @api_router.get("/export")
-async def export_data(user: dict = Depends(get_current_user)):
-    lists = await db.shopping_lists.find(
-        {"user_id": user["user_id"]},
-        {"_id": 0}
-    ).to_list(100)
-    
-    list_ids = [lst["id"] for lst in lists]
-    items = await db.items.find(
-        {"list_id": {"$in": list_ids}},
-        {"_id": 0}
-    ).to_list(1000)
-    
-    return {
-        "lists": lists,
-        "items": items,
-        "exported_at": datetime.now(timezone.utc).isoformat()
-    }
+async def export_data(request: Request, format: Optional[str] = None, user: dict = Depends(get_current_user)):
+    """Stream every list and item of the user.
 
-@api_router.post("/import")
-async def import_data(data: ImportData, user: dict = Depends(get_current_user)):
-    # Map old IDs to new IDs
-    list_id_map = {}
+    Defaults to the {"lists", "items", "exported_at"} JSON document; ask for
+    NDJSON (one record per line, tagged with "type") with
+    `Accept: application/x-ndjson` or `?format=ndjson`.
+    """
+    accept = request.headers.get("accept", "")
+    if format == "ndjson" or (format is None and "application/x-ndjson" in accept):
+        chunks = _export_ndjson_chunks(user["user_id"])
+        media_type = "application/x-ndjson"
+    else:
+        chunks = _export_json_chunks(user["user_id"])
+        media_type = "application/json"
     
-    for lst in data.lists:
-        old_id = lst.get("id")
-        new_id = f"list_{uuid.uuid4().hex[:12]}"
-        list_id_map[old_id] = new_id
-        
+    return StreamingResponse((chunk.encode("utf-8") async for chunk in chunks), media_type=media_type)
+
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '1000'))
+IMPORT_MAX_RECORD_BYTES = 1024 * 1024
+
+class _JSONImportParser:
+    """Incremental parser for the {"lists": [...], "items": [...]} export shape.
+
+    feed() takes text as it arrives and returns the ("list"|"item", dict)
+    records completed so far, so only one record is held at a time.
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._state = "start"
+        self._key = None
+
+    def feed(self, text: str, final: bool = False) -> List[tuple]:
+        self._buffer = self._buffer[self._pos:] + text
+        self._pos = 0
+        records = []
+        while self._step(records, final):
+            pass
+        if len(self._buffer) - self._pos > IMPORT_MAX_RECORD_BYTES:
+            raise ValueError("Import record too large")
+        if final and self._state != "done":
+            raise ValueError("Unexpected end of import data")
+        return records
+
+    def _skip_ws(self):
+        while self._pos < len(self._buffer) and self._buffer[self._pos] in " \t\r\n":
+            self._pos += 1
+        return self._buffer[self._pos] if self._pos < len(self._buffer) else None
+
+    def _decode(self, final: bool):
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            return False, None
+        # A number at the end of the buffer may continue in the next chunk
+        if end == len(self._buffer) and not final:
+            return False, None
+        self._pos = end
+        return True, value
+
+    def _step(self, records: list, final: bool) -> bool:
+        char = self._skip_ws()
+        if char is None or self._state == "done":
+            return False
+        if self._state == "start":
+            if char != "{":
+                raise ValueError("Import data must be a JSON object")
+            self._pos += 1
+            self._state = "key"
+        elif self._state == "key":
+            if char == ",":
+                self._pos += 1
+                return True
+            if char == "}":
+                self._pos += 1
+                self._state = "done"
+                return True
+            ok, key = self._decode(final)
+            if not ok:
+                return False
+            self._key = key
+            self._state = "colon"
+        elif self._state == "colon":
+            if char != ":":
+                raise ValueError("Invalid import data")
+            self._pos += 1
+            self._state = "value"
+        elif self._state == "value":
+            if self._key in ("lists", "items") and char == "[":
+                self._pos += 1
+                self._state = "array"
+                return True
+            ok, _ = self._decode(final)
+            if not ok:
+                return False
+            self._state = "key"
+        elif self._state == "array":
+            if char == ",":
+                self._pos += 1
+                return True
+            if char == "]":
+                self._pos += 1
+                self._state = "key"
+                return True
+            ok, record = self._decode(final)
+            if not ok:
+                return False
+            if isinstance(record, dict):
+                records.append((self._key[:-1], record))
+        return True
+
+class _NDJSONImportParser:
+    """Parser for the NDJSON export: one {"type": ..., ...} record per line."""
+
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, text: str, final: bool = False) -> List[tuple]:
+        self._buffer += text
+        lines = self._buffer.split("\n")
+        self._buffer = "" if final else lines.pop()
+        if len(self._buffer) > IMPORT_MAX_RECORD_BYTES:
+            raise ValueError("Import record too large")
+        records = []
+        for line in lines:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            kind = record.pop("type", None)
+            if kind in ("list", "item"):
+                records.append((kind, record))
+        return records
+
+class _ImportWriter:
+    """Remaps ids and writes imported documents in fixed-size insert_many batches."""
+
+    def __init__(self, user_id: str, version: int):
+        self.user_id = user_id
+        self.version = version
+        self.list_id_map = {}
+        self.filled_list_ids = set()
+        self.next_orders = {}
+        self.pending_items = []
+        self.lists = []
+        self.items = []
+        self.term_counts = {}
+        self.lists_imported = 0
+        self.items_imported = 0
+        self.batches = []
+
+    async def add(self, kind: str, record: dict):
         now = datetime.now(timezone.utc)
-        list_doc = {
-            "id": new_id,
-            "user_id": user["user_id"],
-            "name": lst.get("name", "Imported List"),
-            "created_at": now.isoformat(),
-            "updated_at": now.isoformat()
-        }
-        await db.shopping_lists.insert_one(list_doc)
-    
-    for item in data.items:
-        old_list_id = item.get("list_id")
-        new_list_id = list_id_map.get(old_list_id)
+        if kind == "list":
+            new_id = f"list_{uuid.uuid4().hex[:12]}"
+            self.list_id_map[record.get("id")] = new_id
+            self.lists.append({
+                "id": new_id,
+                "user_id": self.user_id,
+                "name": record.get("name", "Imported List"),
+                "version": self.version,
+                "next_order": 0,
+                "created_at": now,
+                "updated_at": now,
+                **list_search_fields(record.get("name", "Imported List"))
+            })
+            if len(self.lists) >= IMPORT_BATCH_SIZE:
+                await self._flush_lists()
+            return
         
-        if new_list_id:
-            now = datetime.now(timezone.utc)
-            item_doc = {
-                "id": f"item_{uuid.uuid4().hex[:12]}",
-                "list_id": new_list_id,
-                "name": item.get("name", ""),
-                "quantity": item.get("quantity"),
-                "unit": item.get("unit"),
-                "category": item.get("category"),
-                "note": item.get("note"),
-                "is_done": item.get("is_done", False),
-                "priority": item.get("priority"),
-                "order": item.get("order", 0),
-                "created_at": now.isoformat(),
-                "updated_at": now.isoformat()
-            }
-            await db.items.insert_one(item_doc)
+        new_list_id = self.list_id_map.get(record.get("list_id"))
+        if new_list_id is None:
+            # Lists normally come first; keep stragglers until the end
+            self.pending_items.append(record)
+            return
+        self.filled_list_ids.add(new_list_id)
+        order = record.get("order", 0)
+        if isinstance(order, (int, float)) and order >= self.next_orders.get(new_list_id, 0):
+            self.next_orders[new_list_id] = math.floor(order) + 1
+        item_doc = {
+            "id": f"item_{uuid.uuid4().hex[:12]}",
+            "list_id": new_list_id,
+            "user_id": self.user_id,
+            "name": record.get("name", ""),
+            "quantity": record.get("quantity"),
+            "unit": record.get("unit"),
+            "category": record.get("category"),
+            "note": record.get("note"),
+            "is_done": record.get("is_done", False),
+            "priority": record.get("priority"),
+            "order": record.get("order", 0),
+            "version": self.version,
+            "created_at": now,
+            "updated_at": now
+        }
+        item_doc.update(item_search_fields(item_doc))
+        self.items.append(item_doc)
+        if len(self.items) >= IMPORT_BATCH_SIZE:
+            await self._flush_items()
+
+    async def finish(self):
+        await self._flush_lists()
+        pending, self.pending_items = self.pending_items, []
+        for record in pending:
+            if record.get("list_id") in self.list_id_map:
+                await self.add("item", record)
+        await self._flush_items()
+        await bump_next_orders(self.next_orders)
+        await self._touch_filled_lists()
+
+    async def _touch_filled_lists(self):
+        # The lists were written before their items, so a fresh version
+        # moves the ETags of anything read in between
+        if not self.filled_list_ids:
+            return
+        async with change_version(self.user_id) as version:
+            for batch in _chunks(list(self.filled_list_ids), SYNC_BATCH_SIZE):
+                await db.shopping_lists.update_many(
+                    {"id": {"$in": batch}, "user_id": self.user_id},
+                    {"$max": {"version": version}}
+                )
+
+    async def rollback(self):
+        """Remove whatever earlier batches of a failed import already wrote."""
+        new_list_ids = list(self.list_id_map.values())
+        if new_list_ids:
+            await db.items.delete_many({"list_id": {"$in": new_list_ids}})
+            await db.shopping_lists.delete_many({"id": {"$in": new_list_ids}, "user_id": self.user_id})
+
+    async def _flush_lists(self):
+        if self.lists:
+            await db.shopping_lists.insert_many(self.lists, ordered=False)
+            self._record_batch("lists", len(self.lists))
+            self.lists_imported += len(self.lists)
+            self.lists = []
+
+    async def _flush_items(self):
+        if self.items:
+            await db.items.insert_many(self.items, ordered=False)
+            count_terms(self.items, self.term_counts)
+            self._record_batch("items", len(self.items))
+            self.items_imported += len(self.items)
+            self.items = []
+
+    def _record_batch(self, collection: str, count: int):
+        self.batches.append({"collection": collection, "count": count})
+        logger.info(f"Import for {self.user_id}: batch {len(self.batches)} wrote {count} {collection}")
+
+@api_router.post("/import")
+async def import_data(request: Request, user: dict = Depends(get_current_user)):
+    """Import an export file, parsed incrementally from the request stream.
+
+    Accepts the JSON export document or, with Content-Type
+    application/x-ndjson, the NDJSON export.
+    """
+    if "application/x-ndjson" in request.headers.get("content-type", ""):
+        parser = _NDJSONImportParser()
+    else:
+        parser = _JSONImportParser()
+    
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    
+    async with change_version(user["user_id"]) as version:
+        writer = _ImportWriter(user["user_id"], version)
+        try:
+            async for chunk in request.stream():
+                for kind, record in parser.feed(text_decoder.decode(chunk)):
+                    await writer.add(kind, record)
+            for kind, record in parser.feed(text_decoder.decode(b"", final=True), final=True):
+                await writer.add(kind, record)
+            await writer.finish()
+        except (ValueError, UnicodeDecodeError):
+            # json.JSONDecodeError is a ValueError
+            await writer.rollback()
+            raise HTTPException(status_code=400, detail="ملف الاستيراد غير صالح")
+        except Exception:
+            # Any other failure must not leave half an import behind either
+            await writer.rollback()
+            raise
+    suggestion_index.record_counts(user["user_id"], writer.term_counts)
+    for list_id in writer.list_id_map.values():
+        publish_change(user["user_id"], "list.upserted", list_id, version)
     
-    return {"message": "تم استيراد البيانات بنجاح", "lists_imported": len(data.lists)}
+    return {
+        "message": "تم استيراد البيانات بنجاح",
+        "lists_imported": writer.lists_imported,
+        "items_imported": writer.items_imported,
+        "batches": writer.batches
+    }
 
 # ============ SYNC ============
 
+SYNC_BATCH_SIZE = int(os.environ.get('SYNC_BATCH_SIZE', '1000'))
+
+def _chunks(seq: list, size: int):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+async def _bulk_write_batched(collection, ops: list):
+    """Run ops as unordered bulk writes of at most SYNC_BATCH_SIZE.
+
+    Duplicate key errors are skipped: they mean the document id already
+    belongs to another user, which sync must not overwrite.
+    """
+    for batch in _chunks(ops, SYNC_BATCH_SIZE):
+        try:
+            await collection.bulk_write(batch, ordered=False)
+        except BulkWriteError as e:
+            errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+            if errors or e.details.get("writeConcernErrors"):
+                raise
+
+def sync_response(content: dict, response: Response):
+    if FAST_JSON_RESPONSES:
+        return fast_json_response(content, response)
+    return content
+
 @api_router.post("/sync")
-async def sync_data(sync_request: SyncRequest, user: dict = Depends(get_current_user)):
-    """Sync offline changes with server (last write wins)"""
-    synced_lists = []
-    synced_items = []
-    
-    for lst in sync_request.lists:
-        existing = await db.shopping_lists.find_one(
-            {"id": lst.get("id"), "user_id": user["user_id"]},
-            {"_id": 0}
-        )
+async def sync_data(sync_request: SyncRequest, response: Response, user: dict = Depends(get_current_user)):
+    """Sync offline changes with server (last write wins)
+
+    Without since_version the response holds all of the user's data. With
+    it, only lists/items written after that version are returned, plus
+    tombstones in `deleted` for anything removed since.
+    """
+    now = datetime.now(timezone.utc)
+    writes = bool(sync_request.lists or sync_request.items)
+    
+    # Clients push their whole dataset, so anything deleted on another
+    # device since this one last synced would otherwise come back
+    deleted_ids = await tombstoned_ids(
+        user["user_id"],
+        [doc["id"] for doc in (*sync_request.lists, *sync_request.items) if doc.get("id")],
+        sync_request.since_version or 0
+    )
+    
+    async with change_version(user["user_id"]) if writes else nullcontext() as version:
+        list_ops = []
+        synced_list_ids = set()
+        for lst in sync_request.lists:
+            if lst.get("id") in deleted_ids:
+                continue
+            list_id = lst.get("id") or f"list_{uuid.uuid4().hex[:12]}"
+            update = {
+                "$set": {"updated_at": now, "version": version},
+                "$setOnInsert": {"created_at": now, "next_order": 0}
+            }
+            if "name" in lst:
+                update["$set"]["name"] = lst["name"]
+                update["$set"].update(list_search_fields(lst["name"]))
+            else:
+                update["$setOnInsert"]["name"] = "Synced List"
+                update["$setOnInsert"].update(list_search_fields("Synced List"))
+            list_ops.append(UpdateOne({"id": list_id, "user_id": user["user_id"]}, update, upsert=True))
+            synced_list_ids.add(list_id)
         
-        if existing:
-            # Update if client version is newer
-            await db.shopping_lists.update_one(
-                {"id": lst["id"]},
-                {"$set": {
-                    "name": lst.get("name", existing.get("name")),
-                    "updated_at": datetime.now(timezone.utc).isoformat()
-                }}
-            )
-        else:
-            # Create new
-            now = datetime.now(timezone.utc)
-            list_doc = {
-                "id": lst.get("id", f"list_{uuid.uuid4().hex[:12]}"),
-                "user_id": user["user_id"],
-                "name": lst.get("name", "Synced List"),
-                "created_at": now.isoformat(),
-                "updated_at": now.isoformat()
+        await _bulk_write_batched(db.shopping_lists, list_ops)
+        
+        item_ids = [item["id"] for item in sync_request.items if item.get("id")]
+        existing_list_by_item = {}
+        if item_ids:
+            existing_list_by_item = {
+                item["id"]: item.get("list_id") async for item in db.items.find(
+                    {"id": {"$in": item_ids}},
+                    {"_id": 0, "id": 1, "list_id": 1}
+                )
             }
-            await db.shopping_lists.insert_one(list_doc)
         
-        synced_lists.append(lst.get("id"))
-    
-    for item in sync_request.items:
-        existing = await db.items.find_one({"id": item.get("id")}, {"_id": 0})
+        # Items may only be written in lists the user owns, checked in one query
+        candidate_list_ids = {item.get("list_id") for item in sync_request.items}
+        candidate_list_ids.update(existing_list_by_item.values())
+        candidate_list_ids.discard(None)
+        owned_list_ids = set()
+        if candidate_list_ids:
+            owned_list_ids = {
+                lst["id"] async for lst in db.shopping_lists.find(
+                    {"id": {"$in": list(candidate_list_ids)}, "user_id": user["user_id"]},
+                    {"_id": 0, "id": 1}
+                )
+            }
         
-        if existing:
-            # Update
-            await db.items.update_one(
-                {"id": item["id"]},
-                {"$set": {
-                    "name": item.get("name", existing.get("name")),
+        item_ops = []
+        new_items = []
+        unindexed_item_ids = []
+        next_orders = {}
+        touched_list_ids = set()
+        item_ids_by_list = {}
+        for item in sync_request.items:
+            item_id = item.get("id") or f"item_{uuid.uuid4().hex[:12]}"
+            list_id = existing_list_by_item.get(item_id, item.get("list_id"))
+            if list_id not in owned_list_ids or item_id in deleted_ids:
+                continue
+            update = {
+                "$set": {
                     "quantity": item.get("quantity"),
                     "unit": item.get("unit"),
                     "category": item.get("category"),
@@ -701,48 +2198,1371 @@ async def sync_data(sync_request: SyncRequest, user: dict = Depends(get_current_
                     "is_done": item.get("is_done", False),
                     "priority": item.get("priority"),
                     "order": item.get("order", 0),
-                    "updated_at": datetime.now(timezone.utc).isoformat()
-                }}
-            )
-        else:
-            # Create new
-            now = datetime.now(timezone.utc)
-            item_doc = {
-                "id": item.get("id", f"item_{uuid.uuid4().hex[:12]}"),
-                "list_id": item.get("list_id"),
-                "name": item.get("name", ""),
-                "quantity": item.get("quantity"),
-                "unit": item.get("unit"),
-                "category": item.get("category"),
-                "note": item.get("note"),
-                "is_done": item.get("is_done", False),
-                "priority": item.get("priority"),
-                "order": item.get("order", 0),
-                "created_at": now.isoformat(),
-                "updated_at": now.isoformat()
+                    "user_id": user["user_id"],
+                    "version": version,
+                    "updated_at": now
+                },
+                "$setOnInsert": {
+                    "list_id": item.get("list_id"),
+                    "created_at": now
+                }
             }
-            await db.items.insert_one(item_doc)
+            if "name" in item:
+                update["$set"]["name"] = item["name"]
+                update["$set"].update(item_search_fields(update["$set"]))
+            else:
+                update["$setOnInsert"]["name"] = ""
+                unindexed_item_ids.append(item_id)
+            item_ops.append(UpdateOne({"id": item_id}, update, upsert=True))
+            if item_id not in existing_list_by_item:
+                new_items.append(update["$set"])
+            touched_list_ids.add(list_id)
+            item_ids_by_list.setdefault(list_id, []).append(item_id)
+            order = update["$set"]["order"]
+            if isinstance(order, (int, float)) and order >= next_orders.get(list_id, 0):
+                next_orders[list_id] = math.floor(order) + 1
         
-        synced_items.append(item.get("id"))
-    
-    # Get all current data to return to client
-    all_lists = await db.shopping_lists.find(
-        {"user_id": user["user_id"]},
-        {"_id": 0}
-    ).to_list(100)
-    
-    list_ids = [lst["id"] for lst in all_lists]
-    all_items = await db.items.find(
-        {"list_id": {"$in": list_ids}},
-        {"_id": 0}
-    ).to_list(1000)
-    
-    return {
-        "lists": all_lists,
-        "items": all_items,
+        await _bulk_write_batched(db.items, item_ops)
+        await refresh_item_search(unindexed_item_ids)
+        suggestion_index.record(user["user_id"], new_items)
+        await bump_next_orders(next_orders)
+        if touched_list_ids:
+            # Lists whose items changed get a new version, which their ETags
+            # follow. A fresh one: lists upserted above already carry `version`
+            async with change_version(user["user_id"]) as list_version:
+                await db.shopping_lists.update_many(
+                    {"id": {"$in": list(touched_list_ids)}, "user_id": user["user_id"]},
+                    {"$max": {"updated_at": now, "version": list_version}}
+                )
+    
+    for list_id in synced_list_ids - touched_list_ids:
+        publish_change(user["user_id"], "list.upserted", list_id, version)
+    for list_id, changed_ids in item_ids_by_list.items():
+        publish_change(user["user_id"], "items.changed", list_id, version, item_ids=changed_ids, deleted_ids=[])
+    
+    # Every write up to this version has landed, so the queries below see
+    # them all; anything later is picked up by the next delta
+    current_version = await current_change_version(user["user_id"])
+    
+    if sync_request.since_version is None:
+        # All of the user's data, uncapped: `version` tells the client it
+        # has everything up to it, so nothing may be left out
+        all_lists = await db.shopping_lists.find(
+            {"user_id": user["user_id"]},
+            PUBLIC_PROJECTION
+        ).to_list(None)
+        
+        list_ids = [lst["id"] for lst in all_lists]
+        all_items = []
+        for batch in _chunks(list_ids, SYNC_BATCH_SIZE):
+            all_items += await db.items.find(
+                {"list_id": {"$in": batch}},
+                PUBLIC_PROJECTION
+            ).to_list(None)
+        
+        return sync_response({
+            "lists": all_lists,
+            "items": all_items,
+            "deleted": [],
+            "full": True,
+            "version": current_version,
+            "synced_at": datetime.now(timezone.utc).isoformat()
+        }, response)
+    
+    since = sync_request.since_version
+    changed_lists = await db.shopping_lists.find(
+        {"user_id": user["user_id"], "version": {"$gt": since}},
+        PUBLIC_PROJECTION
+    ).to_list(None)
+    
+    changed_items = await db.items.find(
+        {"user_id": user["user_id"], "version": {"$gt": since}},
+        PUBLIC_PROJECTION
+    ).to_list(None)
+    
+    deleted = await db.tombstones.find(
+        {"user_id": user["user_id"], "version": {"$gt": since}},
+        {"_id": 0, "user_id": 0}
+    ).sort("version", 1).to_list(None)
+    
+    return sync_response({
+        "lists": changed_lists,
+        "items": changed_items,
+        "deleted": deleted,
+        "full": False,
+        "version": current_version,
         "synced_at": datetime.now(timezone.utc).isoformat()
+    }, response)
+
+# ============ REAL-TIME EVENTS ============
+
+# Write paths publish small per-list change notices; /stream pushes them to
+# the user's connected devices, which then pull the data with a delta /sync.
+# Each connection is one idle task and a bounded queue, so waiting devices
+# cost no database work. The bus decides how events reach other workers.
+
+class Subscription:
+    def __init__(self, user_id: str, list_ids: Optional[set], queue_size: int):
+        self.user_id = user_id
+        self.list_ids = list_ids
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def wants(self, event: dict) -> bool:
+        return self.list_ids is None or event.get("list_id") in self.list_ids
+
+    def offer(self, event: dict):
+        """Queue without ever blocking the publisher.
+
+        A client that cannot keep up loses its backlog and gets one resync
+        event instead, after which a delta /sync brings it up to date.
+        """
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += self.queue.qsize()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "resync", "version": event.get("version")})
+
+class ChangeHub:
+    """In-process fan-out of change events to the subscriptions of each user."""
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscriptions = {}
+        self.published = 0
+
+    def subscribe(self, user_id: str, list_ids: Optional[set] = None) -> Subscription:
+        subscription = Subscription(user_id, list_ids, self.queue_size)
+        self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscriptions = self._subscriptions.get(subscription.user_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.user_id]
+
+    def dispatch(self, event: dict):
+        self.published += 1
+        for subscription in self._subscriptions.get(event.get("user_id"), ()):
+            if subscription.wants(event):
+                subscription.offer(event)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._subscriptions),
+            "connections": sum(len(subs) for subs in self._subscriptions.values()),
+            "published": self.published
+        }
+
+class LocalEventBus:
+    """Delivers events to this process only; enough for a single worker."""
+
+    def __init__(self, hub: ChangeHub):
+        self.hub = hub
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def publish(self, event: dict):
+        self.hub.dispatch(event)
+
+class MongoEventBus:
+    """Shares events between workers through a capped collection.
+
+    Every worker tails the collection and dispatches what it reads, its own
+    events included, so publishing is a single fire-and-forget insert.
+    """
+
+    def __init__(self, hub: ChangeHub, collection: str, size_bytes: int):
+        self.hub = hub
+        self.collection = collection
+        self.size_bytes = size_bytes
+        self._tail_task = None
+        self._pending = set()
+
+    async def start(self):
+        try:
+            await db.create_collection(self.collection, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            pass
+        self._tail_task = asyncio.create_task(self._tail())
+
+    async def stop(self):
+        if self._tail_task is not None:
+            self._tail_task.cancel()
+            self._tail_task = None
+
+    def publish(self, event: dict):
+        task = asyncio.create_task(self._insert(event))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _insert(self, event: dict):
+        try:
+            await db[self.collection].insert_one({"event": event})
+        except Exception:
+            logger.exception("Publishing change event failed")
+
+    async def _tail(self):
+        collection = db[self.collection]
+        last = await collection.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+        last_id = last["_id"] if last else None
+        while True:
+            try:
+                query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+                cursor = collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+                async for doc in cursor:
+                    last_id = doc["_id"]
+                    self.hub.dispatch(doc["event"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Tailing change events failed")
+            # The cursor dies on an empty collection; retry shortly
+            await asyncio.sleep(1)
+
+change_hub = ChangeHub(STREAM_QUEUE_SIZE)
+if EVENT_BUS == "mongo":
+    event_bus = MongoEventBus(change_hub, EVENT_BUS_COLLECTION, EVENT_BUS_COLLECTION_BYTES)
+else:
+    event_bus = LocalEventBus(change_hub)
+
+def publish_change(user_id: str, event_type: str, list_id: str, version: Optional[int], **fields):
+    """Announce a committed write to the user's connected devices.
+
+    Types are list.upserted, list.deleted and items.changed; items.changed
+    carries item_ids (None meaning any item of the list) and deleted_ids.
+    """
+    event_bus.publish({"type": event_type, "user_id": user_id, "list_id": list_id, "version": version, **fields})
+
+def _sse(event: dict) -> str:
+    payload = {key: value for key, value in event.items() if key != "user_id"}
+    event_id = f"id: {event['version']}\n" if event.get("version") is not None else ""
+    return f"{event_id}event: {event['type']}\ndata: {_dumps(payload)}\n\n"
+
+async def _stream_events(subscription: Subscription, resync_since: Optional[int]):
+    try:
+        yield "retry: 5000\n\n"
+        if resync_since is not None:
+            yield _sse({"type": "resync", "version": resync_since})
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), STREAM_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing the idle connection
+                yield ": keepalive\n\n"
+                continue
+            yield _sse(event)
+    finally:
+        change_hub.unsubscribe(subscription)
+
+async def get_stream_user(request: Request, ticket: Optional[str] = None, credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    # EventSource cannot set headers: browsers send the session cookie
+    # (withCredentials) or a ticket from /stream/ticket. Login tokens never
+    # go in the URL, where access and proxy logs would keep them.
+    if ticket is None:
+        return await get_current_user(request, credentials)
+    payload = decode_jwt_token(ticket)
+    if payload.get("purpose") != "stream":
+        raise HTTPException(status_code=401, detail="Invalid ticket")
+    user = await jwt_user(payload["user_id"])
+    if user is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    await admission.admit_user(request.scope, user["user_id"])
+    return user
+
+@api_router.post("/stream/ticket")
+async def stream_ticket(user: dict = Depends(get_current_user)):
+    """Short-lived credential for opening /stream as `?ticket=`."""
+    return {"ticket": create_stream_ticket(user["user_id"]), "expires_in": STREAM_TICKET_SECONDS}
+
+@api_router.get("/stream")
+async def stream_changes(request: Request, lists: Optional[str] = None, user: dict = Depends(get_stream_user)):
+    """Server-Sent Events feed of the user's list and item changes.
+
+    `lists` is an optional comma-separated list of ids to watch. Event ids
+    are change versions; a reconnect whose Last-Event-ID is behind the
+    current version first gets a resync event.
+    """
+    list_ids = {list_id for list_id in lists.split(",") if list_id} if lists else None
+    
+    resync_since = None
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id:
+        try:
+            last_version = int(last_event_id)
+        except ValueError:
+            last_version = 0
+        if await current_change_version(user["user_id"]) > last_version:
+            resync_since = last_version
+    
+    subscription = change_hub.subscribe(user["user_id"], list_ids)
+    return StreamingResponse(
+        _stream_events(subscription, resync_since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ============ SEARCH ============
+
+# Lists and items carry their normalised words (search_tokens) and every
+# prefix of those words (search_prefixes). Both are rewritten with each text
+# change, so a query is one indexed lookup on (user_id, search_prefixes)
+# whatever the size of the user's history. Items rank by exact name-word
+# matches, then open before done, then most recently updated.
+
+SEARCH_MAX_PREFIX = 20
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_FIELDS = ("search_tokens", "search_prefixes")
+ITEM_SEARCH_SOURCES = ("name", "note", "category")
+
+# What clients receive of stored lists/items: everything but the search index
+PUBLIC_PROJECTION = {"_id": 0, **{field: 0 for field in SEARCH_FIELDS}}
+
+# Quranic annotation marks, tatweel and harakat (tashkeel)
+_ARABIC_MARKS = re.compile("[\u0610-\u061a\u0640\u064b-\u065f\u0670\u06d6-\u06ed]")
+_ARABIC_FOLDS = str.maketrans({
+    "آ": "ا", "أ": "ا", "إ": "ا", "ٱ": "ا",  # alef variants
+    "ى": "ي", "ی": "ي",  # alef maqsura / farsi yeh -> ya
+    "ة": "ه",  # ta marbuta -> ha
+})
+_WORD = re.compile(r"\w+")
+
+def normalize_search_text(text: Optional[Union[str, int, float]]) -> List[str]:
+    """Words of `text` with case, diacritics and letter variants folded.
+
+    Numbers are indexed as their digits; other non-text values have no words.
+    """
+    if isinstance(text, (int, float)) and not isinstance(text, bool):
+        text = str(text)
+    if not text or not isinstance(text, str):
+        return []
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _ARABIC_MARKS.sub("", text).translate(_ARABIC_FOLDS)
+    return _WORD.findall(text)
+
+def _strip_article(word: str) -> str:
+    """The word without the Arabic definite article (الخبز -> خبز)."""
+    return word[2:] if word.startswith("ال") and len(word) > 4 else word
+
+def _indexed_words(text: Optional[str]) -> set:
+    """Normalised words, plus each without the definite article."""
+    words = set()
+    for word in normalize_search_text(text):
+        words.add(word)
+        words.add(_strip_article(word))
+    return words
+
+def search_fields(*texts: Optional[str], tokens_from: Optional[str] = None) -> dict:
+    """search_tokens/search_prefixes for a document.
+
+    Prefixes cover every text; tokens, which drive ranking, only `tokens_from`.
+    """
+    prefixes = set()
+    for text in texts:
+        for word in _indexed_words(text):
+            prefixes.update(word[:size] for size in range(1, min(len(word), SEARCH_MAX_PREFIX) + 1))
+    return {
+        "search_tokens": sorted(_indexed_words(tokens_from)),
+        "search_prefixes": sorted(prefixes)
     }
 
+def list_search_fields(name: Optional[str]) -> dict:
+    return search_fields(name, tokens_from=name)
+
+def item_search_fields(doc: dict) -> dict:
+    return search_fields(*(doc.get(field) for field in ITEM_SEARCH_SOURCES), tokens_from=doc.get("name"))
+
+def item_search_updates(docs: List[dict]) -> List[UpdateOne]:
+    """Re-index items from a snapshot of their text.
+
+    The filter repeats the snapshot, so when text writes race only the one
+    matching the stored text lands.
+    """
+    return [
+        UpdateOne(
+            {"id": doc["id"], **{field: doc.get(field) for field in ITEM_SEARCH_SOURCES}},
+            {"$set": item_search_fields(doc)}
+        )
+        for doc in docs
+    ]
+
+async def refresh_item_search(item_ids: List[str]):
+    """Re-index items after writes that did not know all of their text."""
+    for batch in _chunks(item_ids, SYNC_BATCH_SIZE):
+        docs = await db.items.find(
+            {"id": {"$in": batch}},
+            {"_id": 0, "id": 1, **{field: 1 for field in ITEM_SEARCH_SOURCES}}
+        ).to_list(None)
+        if docs:
+            await db.items.bulk_write(item_search_updates(docs), ordered=False)
+
+@api_router.get("/search")
+async def search(q: str, response: Response, limit: Optional[int] = None, cursor: Optional[str] = None, user: dict = Depends(get_current_user)):
+    """Items (ranked, paginated) and, on the first page, lists matching q.
+
+    Every word of q must prefix a word of the item's name, note or category.
+    """
+    check_page_limit(limit)
+    page_size = limit or SEARCH_DEFAULT_LIMIT
+    offset = 0
+    if cursor:
+        kind, offset = decode_cursor(cursor, cursor_string, cursor_number)
+        if kind != "search" or not isinstance(offset, int) or offset < 0:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    words = normalize_search_text(q)
+    if not words:
+        return sync_response({"items": [], "lists": [], "limit": page_size, "next_cursor": None}, response)
+    # Documents index every word with and without the article, so the bare
+    # form matches both
+    words = sorted({_strip_article(word)[:SEARCH_MAX_PREFIX] for word in words}, key=len, reverse=True)
+    match = {"user_id": user["user_id"], "search_prefixes": {"$all": words}}
+    
+    items = await db.items.aggregate([
+        {"$match": match},
+        # Score and drop the search index in one stage, so the sort only
+        # holds the fields the page returns
+        {"$project": {**ITEM_PROJECTION, "_score": {"$size": {"$filter": {
+            "input": words,
+            "cond": {"$in": ["$$this", {"$ifNull": ["$search_tokens", []]}]}
+        }}}}},
+        {"$sort": {"_score": -1, "is_done": 1, "updated_at": -1, "id": 1}},
+        {"$skip": offset},
+        {"$limit": page_size + 1},
+        {"$project": ITEM_PROJECTION}
+    ]).to_list(None)
+    
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = encode_cursor("search", offset + page_size)
+    
+    lists = []
+    if not cursor:
+        lists = await db.shopping_lists.find(match, LIST_PROJECTION).sort(
+            [("updated_at", -1), ("id", -1)]
+        ).to_list(SEARCH_DEFAULT_LIMIT)
+    
+    return sync_response({
+        "items": fill_defaults(items, _ITEM_DEFAULTS),
+        "lists": fill_defaults(lists, _LIST_DEFAULTS),
+        "limit": page_size,
+        "next_cursor": next_cursor
+    }, response)
+
+# ============ SUGGESTIONS ============
+
+# db.suggestions keeps how often each user has added an item name, unit and
+# category. New items bump those counters in the background; /suggest reads
+# from a per-user sorted term array held in an LRU of recently active users
+# and only goes to Mongo when a user's terms are not loaded.
+
+SUGGEST_KINDS = ("name", "unit", "category")
+SUGGEST_MAX_LIMIT = 50
+
+def suggestion_key(text: Optional[str]) -> str:
+    return " ".join(normalize_search_text(text))
+
+def count_terms(items: List[dict], counts: Optional[dict] = None) -> dict:
+    """(kind, key) -> [latest value, count] over the items' names, units and categories."""
+    counts = {} if counts is None else counts
+    for item in items:
+        for kind in SUGGEST_KINDS:
+            value = item.get(kind)
+            key = suggestion_key(value) if isinstance(value, str) else ""
+            if key:
+                entry = counts.setdefault((kind, key), [value, 0])
+                entry[0] = value.strip()
+                entry[1] += 1
+    return counts
+
+class _UserTerms:
+    """One user's terms, sorted by normalised key for prefix range scans."""
+
+    def __init__(self, docs: List[dict], max_terms: int):
+        self.max_terms = max_terms
+        self.entries = {(doc["kind"], doc["key"]): [doc["value"], doc["count"]] for doc in docs}
+        self.keys = sorted((key, kind) for kind, key in self.entries)
+
+    def add(self, kind: str, key: str, value: str, count: int):
+        entry = self.entries.get((kind, key))
+        if entry is not None:
+            entry[0] = value
+            entry[1] += count
+        elif len(self.entries) < self.max_terms:
+            self.entries[(kind, key)] = [value, count]
+            bisect.insort(self.keys, (key, kind))
+
+    def lookup(self, prefix: str, kind: Optional[str], limit: int) -> List[dict]:
+        matches = []
+        for key, term_kind in itertools.islice(self.keys, bisect.bisect_left(self.keys, (prefix,)), None):
+            if not key.startswith(prefix):
+                break
+            if kind is None or term_kind == kind:
+                value, count = self.entries[(term_kind, key)]
+                matches.append({"kind": term_kind, "value": value, "count": count})
+        return heapq.nlargest(limit, matches, key=lambda match: match["count"])
+
+class SuggestionIndex:
+    """LRU of loaded users' terms with a TTL, so other workers' writes show up."""
+
+    def __init__(self, ttl_seconds: float, max_users: int, max_terms: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self.max_terms = max_terms
+        self._users = OrderedDict()
+        self._pending = set()
+
+    async def lookup(self, user_id: str, prefix: str, kind: Optional[str], limit: int) -> List[dict]:
+        terms = self._get(user_id)
+        if terms is None:
+            docs = await db.suggestions.find(
+                {"user_id": user_id},
+                {"_id": 0, "kind": 1, "key": 1, "value": 1, "count": 1}
+            ).sort("count", -1).to_list(self.max_terms)
+            terms = _UserTerms(docs, self.max_terms)
+            self._set(user_id, terms)
+        return terms.lookup(prefix, kind, limit)
+
+    def record(self, user_id: str, items: List[dict]):
+        """Count the names, units and categories of newly added items."""
+        self.record_counts(user_id, count_terms(items))
+
+    def record_counts(self, user_id: str, counts: dict):
+        if not counts:
+            return
+        
+        terms = self._get(user_id)
+        if terms is not None:
+            for (kind, key), (value, count) in counts.items():
+                terms.add(kind, key, value, count)
+        
+        task = asyncio.create_task(self._persist(user_id, counts))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _persist(self, user_id: str, counts: dict):
+        now = datetime.now(timezone.utc)
+        ops = [
+            UpdateOne(
+                {"user_id": user_id, "kind": kind, "key": key},
+                {"$inc": {"count": count}, "$set": {"value": value, "last_used": now}},
+                upsert=True
+            )
+            for (kind, key), (value, count) in counts.items()
+        ]
+        try:
+            for batch in _chunks(ops, SYNC_BATCH_SIZE):
+                await db.suggestions.bulk_write(batch, ordered=False)
+        except Exception:
+            logger.exception(f"Recording suggestions for {user_id} failed")
+
+    def _get(self, user_id: str) -> Optional[_UserTerms]:
+        entry = self._users.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._users[user_id]
+            return None
+        self._users.move_to_end(user_id)
+        return entry[1]
+
+    def _set(self, user_id: str, terms: _UserTerms):
+        if self.max_users <= 0:
+            return
+        self._users[user_id] = (time.monotonic() + self.ttl_seconds, terms)
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def clear(self):
+        self._users.clear()
+
+suggestion_index = SuggestionIndex(SUGGEST_CACHE_TTL_SECONDS, SUGGEST_CACHE_MAX_USERS, SUGGEST_MAX_TERMS_PER_USER)
+
+@api_router.get("/suggest")
+async def suggest(response: Response, prefix: str = "", kind: Optional[Literal["name", "unit", "category"]] = None, limit: int = 10, user: dict = Depends(get_current_user)):
+    """The user's most frequent names/units/categories starting with prefix."""
+    if not 1 <= limit <= SUGGEST_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {SUGGEST_MAX_LIMIT}")
+    # Keep the trailing space of a finished word so "tomato " skips "tomatoes"
+    key = suggestion_key(prefix)
+    if key and prefix[-1:].isspace():
+        key += " "
+    suggestions = await suggestion_index.lookup(user["user_id"], key, kind, limit)
+    return sync_response({"suggestions": suggestions}, response)
+
+# ============ INDEXES & MIGRATIONS ============
+
+# collection -> list of (keys, options); names are fixed so re-runs are no-ops
+INDEX_SPECS = {
+    "users": [
+        ([("user_id", ASCENDING)], {"name": "user_id_unique", "unique": True}),
+        ([("email", ASCENDING)], {"name": "email_unique", "unique": True}),
+    ],
+    "user_sessions": [
+        ([("session_token", ASCENDING)], {"name": "session_token_unique", "unique": True}),
+        ([("user_id", ASCENDING)], {"name": "user_id"}),
+        ([("expires_at", ASCENDING)], {"name": "expires_at_ttl", "expireAfterSeconds": 0}),
+    ],
+    "shopping_lists": [
+        ([("id", ASCENDING)], {"name": "id_unique", "unique": True}),
+        ([("user_id", ASCENDING), ("updated_at", DESCENDING), ("id", DESCENDING)], {"name": "user_id_updated_at_id"}),
+        ([("user_id", ASCENDING), ("version", ASCENDING)], {"name": "user_id_version"}),
+        ([("user_id", ASCENDING), ("search_prefixes", ASCENDING)], {"name": "user_id_search_prefixes"}),
+    ],
+    "items": [
+        ([("id", ASCENDING)], {"name": "id_unique", "unique": True}),
+        ([("list_id", ASCENDING), ("order", ASCENDING), ("id", ASCENDING)], {"name": "list_id_order_id"}),
+        ([("user_id", ASCENDING), ("version", ASCENDING)], {"name": "user_id_version"}),
+        ([("user_id", ASCENDING), ("search_prefixes", ASCENDING)], {"name": "user_id_search_prefixes"}),
+    ],
+    "suggestions": [
+        ([("user_id", ASCENDING), ("kind", ASCENDING), ("key", ASCENDING)], {"name": "user_id_kind_key_unique", "unique": True}),
+        ([("user_id", ASCENDING), ("count", DESCENDING)], {"name": "user_id_count"}),
+    ],
+    "tombstones": [
+        ([("user_id", ASCENDING), ("version", ASCENDING)], {"name": "user_id_version"}),
+        ([("user_id", ASCENDING), ("id", ASCENDING)], {"name": "user_id_id"}),
+    ],
+}
+
+async def ensure_indexes(database=None) -> List[str]:
+    """Create every index in INDEX_SPECS; returns the specs that failed."""
+    database = database if database is not None else db
+    failed = []
+    for collection, specs in INDEX_SPECS.items():
+        for keys, options in specs:
+            try:
+                await database[collection].create_index(keys, **options)
+            except OperationFailure as e:
+                # e.g. duplicate emails left over from before the unique index
+                logger.error(f"Could not create index {collection}.{options['name']}: {e}")
+                failed.append(f"{collection}.{options['name']}")
+    return failed
+
+# Indexes that correctness, not just speed, depends on: register relies on
+# email_unique to turn a second sign-up with the same address into a 400
+REQUIRED_UNIQUE_INDEXES = [("users", "email_unique")]
+
+async def check_required_indexes(database=None):
+    """Raise when an index in REQUIRED_UNIQUE_INDEXES is missing or not unique."""
+    database = database if database is not None else db
+    missing = []
+    for collection, name in REQUIRED_UNIQUE_INDEXES:
+        info = (await database[collection].index_information()).get(name)
+        if info is None or not info.get("unique"):
+            missing.append(f"{collection}.{name}")
+    if missing:
+        raise RuntimeError(
+            f"Missing unique indexes: {', '.join(missing)}. "
+            "Remove the duplicates and run `python manage.py ensure-indexes`"
+        )
+
+MIGRATION_BATCH_SIZE = 500
+# How often a worker re-reads whether a migration it falls back for has run
+MIGRATION_RECHECK_SECONDS = float(os.environ.get('MIGRATION_RECHECK_SECONDS', '30'))
+
+async def _migrate_iso_strings_to_datetime(database, collection: str, fields: List[str]):
+    """Rewrite ISO-8601 string timestamps as BSON dates in small batches.
+
+    Runs online: reads tolerate both representations until it finishes.
+    """
+    for field in fields:
+        while True:
+            docs = await database[collection].find(
+                {field: {"$type": "string"}},
+                {"_id": 1, field: 1}
+            ).to_list(MIGRATION_BATCH_SIZE)
+            if not docs:
+                break
+            ops = []
+            for doc in docs:
+                value = datetime.fromisoformat(doc[field])
+                if value.tzinfo is None:
+                    value = value.replace(tzinfo=timezone.utc)
+                ops.append(UpdateOne({"_id": doc["_id"], field: doc[field]}, {"$set": {field: value}}))
+            await database[collection].bulk_write(ops, ordered=False)
+
+async def _migrate_session_expiry_to_datetime(database):
+    """TTL indexes only expire BSON dates, so convert ISO string expiries."""
+    await _migrate_iso_strings_to_datetime(database, "user_sessions", ["expires_at"])
+
+async def _migrate_timestamps_to_datetime(database):
+    await _migrate_iso_strings_to_datetime(database, "users", ["created_at"])
+    await _migrate_iso_strings_to_datetime(database, "user_sessions", ["created_at"])
+    await _migrate_iso_strings_to_datetime(database, "shopping_lists", ["created_at", "updated_at"])
+    await _migrate_iso_strings_to_datetime(database, "items", ["created_at", "updated_at"])
+
+async def _drop_superseded_sort_indexes(database):
+    """The keyset pagination indexes add `id` as a tie-breaker."""
+    for collection, name in [("shopping_lists", "user_id_updated_at"), ("items", "list_id_order")]:
+        if name in await database[collection].index_information():
+            await database[collection].drop_index(name)
+
+async def _backfill_item_user_ids(database):
+    """Copy each list's owner onto its items, a batch of lists at a time."""
+    cursor = database.shopping_lists.find({}, {"_id": 0, "id": 1, "user_id": 1}).batch_size(MIGRATION_BATCH_SIZE)
+    ops = []
+    async for lst in cursor:
+        ops.append(UpdateMany(
+            {"list_id": lst["id"], "user_id": {"$exists": False}},
+            {"$set": {"user_id": lst["user_id"]}}
+        ))
+        if len(ops) >= MIGRATION_BATCH_SIZE:
+            await database.items.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await database.items.bulk_write(ops, ordered=False)
+    if "list_id_version" in await database.items.index_information():
+        await database.items.drop_index("list_id_version")
+
+async def _seed_list_order_counters(database):
+    """Start each list's next_order after its highest item order."""
+    pipeline = [{"$group": {"_id": "$list_id", "max_order": {"$max": "$order"}}}]
+    ops = []
+    async for group in database.items.aggregate(pipeline):
+        if isinstance(group.get("max_order"), (int, float)):
+            ops.append(UpdateOne({"id": group["_id"]}, {"$max": {"next_order": math.floor(group["max_order"]) + 1}}))
+        if len(ops) >= MIGRATION_BATCH_SIZE:
+            await database.shopping_lists.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await database.shopping_lists.bulk_write(ops, ordered=False)
+    await database.shopping_lists.update_many(
+        {"next_order": {"$exists": False}},
+        {"$set": {"next_order": 0}}
+    )
+
+async def _build_search_index(database):
+    """Index lists and items written before search existed."""
+    sources = {
+        "shopping_lists": (("name",), lambda doc: list_search_fields(doc.get("name"))),
+        "items": (ITEM_SEARCH_SOURCES, item_search_fields),
+    }
+    for collection, (fields, build) in sources.items():
+        while True:
+            docs = await database[collection].find(
+                {"search_prefixes": {"$exists": False}},
+                {"_id": 1, **{field: 1 for field in fields}}
+            ).to_list(MIGRATION_BATCH_SIZE)
+            if not docs:
+                break
+            await database[collection].bulk_write([
+                UpdateOne({"_id": doc["_id"]}, {"$set": build(doc)})
+                for doc in docs
+            ], ordered=False)
+
+async def _build_suggestions(database):
+    """Seed suggestion counts from existing items, one user at a time.
+
+    Counts are set rather than incremented, so a re-run is harmless.
+    """
+    async def write(user_id: str, counts: dict):
+        ops = [
+            UpdateOne(
+                {"user_id": user_id, "kind": kind, "key": key},
+                {"$max": {"count": count}, "$setOnInsert": {"value": value}},
+                upsert=True
+            )
+            for (kind, key), (value, count) in counts.items()
+        ]
+        for batch in _chunks(ops, MIGRATION_BATCH_SIZE):
+            await database.suggestions.bulk_write(batch, ordered=False)
+    
+    cursor = database.items.find(
+        {"user_id": {"$exists": True}},
+        {"_id": 0, "user_id": 1, **{kind: 1 for kind in SUGGEST_KINDS}}
+    ).sort("user_id", 1).batch_size(MIGRATION_BATCH_SIZE)
+    user_id, counts = None, {}
+    async for item in cursor:
+        if item["user_id"] != user_id:
+            if counts:
+                await write(user_id, counts)
+            user_id, counts = item["user_id"], {}
+        count_terms([item], counts)
+    if counts:
+        await write(user_id, counts)
+
+class MigrationStatus:
+    """Which migrations are recorded as applied, for fallbacks that are only
+    needed until one has run.
+
+    Applied is cached for good; not applied is re-read at most every
+    `recheck_seconds`, so another worker finishing a migration shows up.
+    """
+
+    def __init__(self, recheck_seconds: float):
+        self.recheck_seconds = recheck_seconds
+        self._applied = set()
+        self._checked_at = {}
+
+    async def applied(self, version: int) -> bool:
+        if version in self._applied:
+            return True
+        now = time.monotonic()
+        checked_at = self._checked_at.get(version)
+        if checked_at is not None and now - checked_at < self.recheck_seconds:
+            return False
+        self._checked_at[version] = now
+        if await db.migrations.count_documents({"_id": version}, limit=1):
+            self._applied.add(version)
+            return True
+        return False
+
+    def mark_applied(self, version: int):
+        self._applied.add(version)
+
+    def clear(self):
+        self._applied.clear()
+        self._checked_at.clear()
+
+migration_status = MigrationStatus(MIGRATION_RECHECK_SECONDS)
+
+# (version, description, coroutine); append only, never renumber
+MIGRATIONS = [
+    (1, "session expires_at as BSON datetime", _migrate_session_expiry_to_datetime),
+    (2, "created_at/updated_at as BSON datetime", _migrate_timestamps_to_datetime),
+    (3, "drop sort indexes superseded by keyset pagination indexes", _drop_superseded_sort_indexes),
+    (4, "items.user_id backfill", _backfill_item_user_ids),
+    (5, "per-list next_order counters", _seed_list_order_counters),
+    (6, "search tokens and prefixes for lists and items", _build_search_index),
+    (7, "suggestion counts from item history", _build_suggestions),
+]
+
+async def run_migrations(database=None) -> List[int]:
+    """Apply pending migrations in version order; returns applied versions.
+
+    Migrations must be idempotent: two workers starting together may both run
+    one before either records it.
+    """
+    own_database = database is None
+    database = database if database is not None else db
+    done = {m["_id"] async for m in database.migrations.find({}, {"_id": 1})}
+    applied = []
+    for version, description, migration in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in done:
+            if own_database:
+                migration_status.mark_applied(version)
+            continue
+        logger.info(f"Applying migration {version}: {description}")
+        await migration(database)
+        await database.migrations.update_one(
+            {"_id": version},
+            {"$set": {"description": description, "applied_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        applied.append(version)
+        if own_database:
+            migration_status.mark_applied(version)
+    return applied
+
+# ============ COMPRESSION ============
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+# Event streams stay plain: a compressor per idle connection costs ~256 KB
+UNCOMPRESSED_TYPES = ("text/event-stream",)
+
+def _accepted_encodings(header: str) -> dict:
+    encodings = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            encodings[name.strip().lower()] = quality
+    return encodings
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = _accepted_encodings(accept_encoding)
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes) -> bytes:
+        """Compress and flush so a streamed chunk reaches the client now."""
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush()
+
+# Brotli before 1.2 cannot cap a decompressor's output, so br request
+# bodies are only accepted when it can
+BROTLI_BOUNDED_DECOMPRESS = brotli is not None and hasattr(brotli.Decompressor, "can_accept_more_data")
+
+class _Decompressor:
+    """Inflates request body chunks without producing more than asked for."""
+
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._brotli = brotli.Decompressor()
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decompress(self, data: bytes, max_length: int) -> bytes:
+        """Inflate `data`; output beyond `max_length` is not produced.
+
+        A result longer than `max_length` means the body is over the
+        limit; brotli may overshoot by one internal buffer.
+        """
+        if self._zlib is not None:
+            return self._zlib.decompress(data, max_length + 1)
+        out = self._brotli.process(data, output_buffer_limit=max_length + 1)
+        while len(out) <= max_length and not self._brotli.can_accept_more_data():
+            out += self._brotli.process(b"", output_buffer_limit=max_length + 1 - len(out))
+        return out
+
+class CompressionMiddleware:
+    """Negotiated gzip/brotli for responses and gzip/brotli request bodies.
+
+    Responses smaller than COMPRESSION_MIN_SIZE, non-text responses and ones
+    that already carry a Content-Encoding pass through. Streaming responses
+    are compressed chunk by chunk rather than buffered.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        headers = Headers(scope=scope)
+        request_encoding = headers.get("content-encoding", "").strip().lower()
+        if request_encoding and request_encoding != "identity":
+            if request_encoding not in ("gzip", "br") or (request_encoding == "br" and not BROTLI_BOUNDED_DECOMPRESS):
+                response = JSONResponse({"detail": "Unsupported Content-Encoding"}, status_code=415)
+                await response(scope, receive, send)
+                return
+            scope = dict(scope)
+            scope["headers"] = [
+                (name, value) for name, value in scope["headers"]
+                if name not in (b"content-encoding", b"content-length")
+            ]
+            receive = self._decompressing_receive(receive, request_encoding)
+        
+        encoding = choose_encoding(headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, self._compressing_send(send, encoding))
+
+    def _decompressing_receive(self, receive, encoding: str):
+        decompressor = _Decompressor(encoding)
+        remaining = MAX_DECOMPRESSED_BODY_BYTES
+        
+        async def wrapped():
+            nonlocal remaining
+            message = await receive()
+            if message["type"] == "http.request":
+                # Inflate at most one byte past the limit, so a small
+                # compression bomb never expands in memory
+                try:
+                    body = decompressor.decompress(message.get("body", b""), remaining)
+                except Exception:
+                    raise HTTPException(status_code=400, detail="Invalid compressed body")
+                if len(body) > remaining:
+                    raise HTTPException(status_code=413, detail="Request body too large")
+                remaining -= len(body)
+                message = {**message, "body": body}
+            return message
+        
+        return wrapped
+
+    def _compressing_send(self, send, encoding: str):
+        start_message = None
+        compressor = None
+        
+        async def wrapped(message):
+            nonlocal start_message, compressor
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+            
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            
+            if compressor is None:
+                response_headers = MutableHeaders(raw=list(start_message["headers"]))
+                content_type = response_headers.get("content-type", "")
+                compressible = (
+                    "content-encoding" not in response_headers
+                    and content_type.startswith(COMPRESSIBLE_TYPES)
+                    and not content_type.startswith(UNCOMPRESSED_TYPES)
+                    and (more_body or len(body) >= COMPRESSION_MIN_SIZE)
+                )
+                if not compressible:
+                    await send(start_message)
+                    await send(message)
+                    start_message = None
+                    return
+                
+                compressor = _Compressor(encoding)
+                response_headers["Content-Encoding"] = encoding
+                response_headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del response_headers["content-length"]
+                    body = compressor.chunk(body)
+                else:
+                    body = compressor.finish(body)
+                    response_headers["Content-Length"] = str(len(body))
+                await send({**start_message, "headers": response_headers.raw})
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+                return
+            
+            body = compressor.chunk(body) if more_body else compressor.finish(body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+        
+        return wrapped
+
+# ============ ADMISSION CONTROL ============
+
+# Requests are sorted into route classes. Each class has token buckets per
+# client IP (taken here, when ADMISSION_IP_LIMITS is on) and per verified
+# user (taken by get_current_user), and a cap on requests in flight in this
+# worker. An empty bucket is answered with 429 and a full class with 503,
+# both carrying Retry-After, so overload is shed instead of queued. Buckets
+# live in a pluggable store so limits can later be shared by workers; the
+# in-flight caps protect this process and stay local.
+
+ROUTE_CLASSES = [
+    # (class, method or None for any, paths)
+    ("auth", "POST", ("/api/auth/login", "/api/auth/register", "/api/auth/session")),
+    ("bulk", None, ("/api/sync", "/api/import", "/api/export")),
+]
+
+# Rates are requests per second; None disables a limit
+ADMISSION_LIMITS = {
+    "auth": {"ip_rate": 0.5, "ip_burst": 10, "user_rate": None, "user_burst": None, "max_in_flight": 32},
+    "bulk": {"ip_rate": 2, "ip_burst": 20, "user_rate": 1, "user_burst": 10, "max_in_flight": 16},
+    "default": {"ip_rate": 50, "ip_burst": 200, "user_rate": 20, "user_burst": 100, "max_in_flight": None},
+}
+for route_class, overrides in json.loads(os.environ.get('ADMISSION_LIMITS', '{}')).items():
+    ADMISSION_LIMITS.setdefault(route_class, dict(ADMISSION_LIMITS["default"])).update(overrides)
+
+class MemoryBucketStore:
+    """Token buckets in this process, least recently used evicted first.
+
+    Another store only needs the same `take` coroutine.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    async def take(self, key: tuple, rate: float, burst: float) -> float:
+        """Take a token; returns 0 or the seconds until one is available."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        self._buckets.clear()
+
+class AdmissionController:
+    def __init__(self, limits: dict, store):
+        self.limits = limits
+        self.store = store
+        self.in_flight = {route_class: 0 for route_class in limits}
+        self.admitted = {route_class: 0 for route_class in limits}
+        # (class, "ip_rate" | "user_rate" | "concurrency") -> count
+        self.rejected = {}
+
+    def classify(self, method: str, path: str) -> str:
+        for route_class, route_method, paths in ROUTE_CLASSES:
+            if (route_method is None or route_method == method) and path in paths:
+                return route_class
+        return "default"
+
+    async def admit(self, route_class: str, ip: Optional[str]) -> Optional[Response]:
+        """Reserve a slot for the request, or return the rejection to send."""
+        limits = self.limits[route_class]
+        wait = await self._take(route_class, "ip_rate", ip)
+        if wait > 0:
+            return self._reject(route_class, "ip_rate", 429, "Too many requests", wait)
+        
+        max_in_flight = limits["max_in_flight"]
+        if max_in_flight is not None and self.in_flight[route_class] >= max_in_flight:
+            return self._reject(route_class, "concurrency", 503, "Server busy", 1)
+        self.in_flight[route_class] += 1
+        self.admitted[route_class] += 1
+        return None
+
+    async def admit_user(self, scope, user_id: str):
+        """Take from the authenticated user's bucket; raises 429 when it is empty.
+
+        Runs once the user is known, for requests the middleware admitted.
+        """
+        route_class = scope.get(ADMISSION_SCOPE_KEY)
+        if route_class is None:
+            return
+        wait = await self._take(route_class, "user_rate", user_id)
+        if wait > 0:
+            self._count_rejection(route_class, "user_rate")
+            raise HTTPException(status_code=429, detail="Too many requests", headers=_retry_after(wait))
+
+    def release(self, route_class: str):
+        self.in_flight[route_class] -= 1
+
+    async def _take(self, route_class: str, reason: str, key: Optional[str]) -> float:
+        limits = self.limits[route_class]
+        rate = limits[reason]
+        if rate is None or key is None:
+            return 0
+        burst = limits[reason.replace("rate", "burst")] or 1
+        return await self.store.take((route_class, reason, key), rate, burst)
+
+    def _count_rejection(self, route_class: str, reason: str):
+        key = (route_class, reason)
+        self.rejected[key] = self.rejected.get(key, 0) + 1
+
+    def _reject(self, route_class: str, reason: str, status_code: int, detail: str, retry_after: float) -> Response:
+        self._count_rejection(route_class, reason)
+        return JSONResponse({"detail": detail}, status_code=status_code, headers=_retry_after(retry_after))
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": dict(self.in_flight),
+            "admitted": dict(self.admitted),
+            "rejected": {f"{route_class}:{reason}": count for (route_class, reason), count in self.rejected.items()}
+        }
+
+def _retry_after(seconds: float) -> dict:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+admission = AdmissionController(ADMISSION_LIMITS, MemoryBucketStore(ADMISSION_MAX_BUCKETS))
+
+# Where the middleware leaves the request's route class for admit_user
+ADMISSION_SCOPE_KEY = "admission.route_class"
+
+def client_ip(scope) -> Optional[str]:
+    if TRUSTED_PROXY_HOPS > 0:
+        hops = [
+            hop.strip()
+            for value in Headers(scope=scope).getlist("x-forwarded-for")
+            for hop in value.split(",")
+        ]
+        # Entries left of the ones our proxies appended are client-supplied;
+        # the innermost trusted entry is the address our outermost proxy saw
+        if len(hops) >= TRUSTED_PROXY_HOPS and hops[-TRUSTED_PROXY_HOPS]:
+            return hops[-TRUSTED_PROXY_HOPS]
+    client_addr = scope.get("client")
+    return client_addr[0] if client_addr else None
+
+class AdmissionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not ADMISSION_CONTROL or scope["type"] != "http" or scope["method"] == "OPTIONS" or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+        
+        route_class = admission.classify(scope["method"], scope["path"])
+        rejection = await admission.admit(route_class, client_ip(scope) if ADMISSION_IP_LIMITS else None)
+        if rejection is not None:
+            await rejection(scope, receive, send)
+            return
+        scope[ADMISSION_SCOPE_KEY] = route_class
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.release(route_class)
+
+# ============ METRICS ============
+
+# Prometheus text exposition at /metrics. Request series are labelled with
+# the route template, never the raw path, so label sets stay bounded.
+# Component state (bcrypt pool, caches, admission, streams) is read at
+# scrape time rather than mirrored on every call.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+metrics = MetricsRegistry()
+http_requests = metrics.counter("http_requests_total", "HTTP requests by method, route and status", ("method", "route", "status"))
+http_latency = metrics.histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"), LATENCY_BUCKETS)
+http_response_size = metrics.histogram("http_response_size_bytes", "HTTP response body size before compression", ("method", "route"), SIZE_BUCKETS)
+http_in_flight = metrics.gauge("http_requests_in_flight", "HTTP requests being handled, by admission route class", ("class",))
+loop_lag = metrics.gauge("event_loop_lag_seconds", "Latest event loop lag sample")
+loop_lag_histogram = metrics.histogram("event_loop_lag_samples_seconds", "Event loop lag samples", (), LOOP_LAG_BUCKETS)
+metrics.register(mongo_command_metrics.commands, mongo_command_metrics.duration)
+
+def _bcrypt_stats(*keys):
+    return lambda: {(key,): password_hasher.stats()[key] for key in keys}
+
+metrics.callback("bcrypt_executor_tasks", "bcrypt calls waiting for or running on the executor", ("state",), _bcrypt_stats("queued", "running"))
+metrics.callback("bcrypt_calls_total", "Completed bcrypt hashes and verifications", (), lambda: {(): password_hasher.calls}, kind="counter")
+metrics.callback("bcrypt_queue_wait_seconds_total", "Time bcrypt calls spent queued", (), lambda: {(): password_hasher.queue_wait_total}, kind="counter")
+metrics.callback("bcrypt_hash_seconds_total", "Time spent hashing", (), lambda: {(): password_hasher.hash_time_total}, kind="counter")
+metrics.callback("principal_cache_entries", "Cached authenticated principals", (), lambda: {(): principal_cache.stats()["size"]})
+metrics.callback(
+    "principal_cache_lookups_total", "Principal cache lookups by result", ("result",),
+    lambda: {("hit",): principal_cache.hits, ("miss",): principal_cache.misses}, kind="counter"
+)
+metrics.callback(
+    "admission_rejected_total", "Requests shed by admission control", ("class", "reason"),
+    lambda: dict(admission.rejected), kind="counter"
+)
+metrics.callback("stream_connections", "Open /stream connections", (), lambda: {(): change_hub.stats()["connections"]})
+metrics.callback("suggestion_index_users", "Users with suggestions loaded in memory", (), lambda: {(): len(suggestion_index)})
+metrics.callback(
+    "auth_provider_circuit_open", "1 while the auth provider circuit breaker rejects calls", (),
+    lambda: {(): 0 if auth_provider.breaker.state == "closed" else 1}
+)
+
+def is_event_stream(message) -> bool:
+    return Headers(raw=message["headers"]).get("content-type", "").startswith("text/event-stream")
+
+class MetricsMiddleware:
+    """Counts, times and sizes requests; added innermost so the matched route is known."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not METRICS_ENABLED or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        route_class = (admission.classify(scope["method"], scope["path"]),)
+        status = 500
+        size = 0
+        streaming = False
+        
+        async def wrapped(message):
+            nonlocal status, size, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                streaming = is_event_stream(message)
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+        
+        http_in_flight.inc(route_class)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, wrapped)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_in_flight.dec(route_class)
+            route = scope.get("route")
+            labels = (scope["method"], route.path if route is not None else "unmatched")
+            http_requests.inc(labels + (status,))
+            # An event stream lasts as long as the client stays connected
+            if not streaming:
+                http_latency.observe(elapsed, labels)
+            http_response_size.observe(size, labels)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    if not METRICS_TOKEN:
+        if not METRICS_PUBLIC:
+            raise HTTPException(status_code=404, detail="Not Found")
+    elif credentials is None or not hmac.compare_digest(credentials.credentials.encode(), METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# ============ DB PROFILER ============
+
+# Every request collects the Mongo commands it issues (see DBProfile).
+# Requests slower than DB_PROFILE_SLOW_MS are logged with their command
+# breakdown, except event streams, which last as long as the client stays;
+# sending `X-DB-Profile: <DB_PROFILE_TOKEN>` (or DB_PROFILE_HEADERS=true) adds
+# Server-Timing and X-DB-Calls headers, which tests/db_budget.py checks.
+
+def _profile_requested(scope) -> bool:
+    requested = Headers(scope=scope).get("x-db-profile")
+    return bool(DB_PROFILE_TOKEN and requested) and hmac.compare_digest(requested.encode(), DB_PROFILE_TOKEN.encode())
+
+class DBProfilerMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not DB_PROFILE_ENABLED or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        want_headers = DB_PROFILE_HEADERS or _profile_requested(scope)
+        profile = DBProfile()
+        streaming = False
+        
+        async def wrapped(message):
+            nonlocal streaming
+            if message["type"] == "http.response.start":
+                streaming = is_event_stream(message)
+            if want_headers and message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=list(message["headers"]))
+                headers.append("Server-Timing", profile.server_timing())
+                headers["X-DB-Calls"] = str(profile.count)
+                message = {**message, "headers": headers.raw}
+            await send(message)
+        
+        token = current_db_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, wrapped)
+        finally:
+            current_db_profile.reset(token)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if elapsed_ms >= DB_PROFILE_SLOW_MS and not streaming:
+                route = scope.get("route")
+                breakdown = ", ".join(
+                    f"{name} x{calls} {seconds * 1000:.1f}ms" for name, calls, seconds in profile.breakdown()
+                )
+                logger.warning(
+                    f"Slow request {scope['method']} {route.path if route is not None else scope['path']}: "
+                    f"{elapsed_ms:.0f}ms, {profile.count} DB calls ({profile.seconds * 1000:.0f}ms) {breakdown}"
+                )
+
 # ============ ROOT ============
 
 @api_router.get("/")
@@ -752,6 +3572,14 @@ async def root():
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(DBProfilerMiddleware)
+
+app.add_middleware(MetricsMiddleware)
+
+app.add_middleware(AdmissionMiddleware)
+
+app.add_middleware(CompressionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -767,6 +3595,33 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def bootstrap_db():
+    await event_bus.start()
+    auth_provider.start()
+    if METRICS_ENABLED:
+        app.state.loop_lag_task = asyncio.create_task(
+            monitor_loop_lag(loop_lag, loop_lag_histogram, LOOP_LAG_INTERVAL_SECONDS)
+        )
+    if DB_BOOTSTRAP_ON_STARTUP:
+        await ensure_indexes()
+    # Refuse to serve without them, bootstrapped here or not
+    await check_required_indexes()
+    if DB_BOOTSTRAP_ON_STARTUP:
+        # Migrations run online; read paths accept both old and new formats
+        app.state.migrations_task = asyncio.create_task(_run_migrations_in_background())
+
+async def _run_migrations_in_background():
+    try:
+        await run_migrations()
+    except Exception:
+        logger.exception("Background migration failed")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await event_bus.stop()
+    await auth_provider.close()
+    if getattr(app.state, "loop_lag_task", None) is not None:
+        app.state.loop_lag_task.cancel()
     client.close()
+    password_hasher.shutdown()
@@ -0,0 +1,48 @@
+import os
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "shoppinglist_test")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def database(monkeypatch):
+    client = mongomock_motor.AsyncMongoMockClient(tz_aware=True)
+    database = client[os.environ["DB_NAME"]]
+    monkeypatch.setattr(server, "client", client)
+    monkeypatch.setattr(server, "db", database)
+    server.principal_cache.clear()
+    server.suggestion_index.clear()
+    server.session_exchanges.clear()
+    server.admission.store.clear()
+    server.admission.rejected.clear()
+    server.migration_status.clear()
+    return database
+
+
+@pytest.fixture
+async def api(database):
+    """The app over ASGI; requests from one test run on the test's event loop."""
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+async def register(api, email="user@example.com") -> dict:
+    response = await api.post("/api/auth/register", json={"email": email, "password": "secret123", "name": "User"})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['token']}"}
@@ -0,0 +1,80 @@
+"""Mongo round-trip budgets for API tests.
+
+Call allow_profile_header() to give the server PROFILE_TOKEN, send
+PROFILE_HEADER with a request and assert on the response, so an endpoint
+that grows an extra query (or an N+1 loop) fails its test:
+
+    response = await api.put(url, json=body, headers={**auth, **PROFILE_HEADER})
+    assert_db_budget(response, 3)
+
+mongomock issues no command events, so against it call
+report_mock_commands() first; it records one command per driver call the
+way the command listener does for a real server.
+"""
+
+import server
+from metrics import current_db_profile
+
+PROFILE_TOKEN = "db-budget"
+PROFILE_HEADER = {"X-DB-Profile": PROFILE_TOKEN}
+
+# Motor collection methods and the command each sends to the server
+MOCK_COMMANDS = {
+    "find_one": "find",
+    "find": "find",
+    "aggregate": "aggregate",
+    "count_documents": "aggregate",
+    "distinct": "distinct",
+    "insert_one": "insert",
+    "insert_many": "insert",
+    "update_one": "update",
+    "update_many": "update",
+    "replace_one": "update",
+    "delete_one": "delete",
+    "delete_many": "delete",
+    "find_one_and_update": "findAndModify",
+    "find_one_and_delete": "findAndModify",
+    "find_one_and_replace": "findAndModify",
+    # One command per run of same-kind operations on a real server; the
+    # endpoints under budget send one kind at a time
+    "bulk_write": "bulkWrite",
+}
+
+
+def allow_profile_header(monkeypatch):
+    """Make the server honour PROFILE_HEADER for the test."""
+    monkeypatch.setattr(server, "DB_PROFILE_TOKEN", PROFILE_TOKEN)
+
+
+def report_mock_commands(monkeypatch):
+    """Add every mongomock_motor collection call to the request's DBProfile."""
+    from mongomock_motor import AsyncMongoMockCollection
+
+    def reporting(method, command):
+        def wrapper(self, *args, **kwargs):
+            profile = current_db_profile.get()
+            if profile is not None:
+                profile.commands.append((self.name, command, 0.0))
+            return method(self, *args, **kwargs)
+        return wrapper
+
+    for name, command in MOCK_COMMANDS.items():
+        monkeypatch.setattr(AsyncMongoMockCollection, name, reporting(getattr(AsyncMongoMockCollection, name), command))
+
+
+def db_calls(response) -> int:
+    """Mongo commands the server issued while handling `response`."""
+    value = response.headers.get("X-DB-Calls")
+    if value is None:
+        raise AssertionError("Response has no X-DB-Calls header; call allow_profile_header(), send PROFILE_HEADER and keep DB_PROFILE_ENABLED on")
+    return int(value)
+
+
+def assert_db_budget(response, max_calls: int):
+    calls = db_calls(response)
+    if calls > max_calls:
+        request = response.request
+        raise AssertionError(
+            f"{request.method} {request.url.path} made {calls} DB calls (budget {max_calls}): "
+            f"{response.headers.get('Server-Timing', '')}"
+        )
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+
+from .conftest import register
+
+
+def scope(*forwarded: str) -> dict:
+    return {
+        "type": "http",
+        "client": ("10.0.0.1", 50000),
+        "headers": [(b"x-forwarded-for", value.encode()) for value in forwarded],
+    }
+
+
+def test_forwarded_for_is_ignored_without_trusted_proxies():
+    assert server.client_ip(scope("203.0.113.9")) == "10.0.0.1"
+
+
+@pytest.mark.parametrize("hops, forwarded, expected", [
+    (1, ["198.51.100.7"], "198.51.100.7"),
+    # A client-supplied entry sits left of the one our proxy appended
+    (1, ["1.2.3.4, 198.51.100.7"], "198.51.100.7"),
+    (2, ["1.2.3.4, 198.51.100.7, 10.0.0.2"], "198.51.100.7"),
+    (2, ["1.2.3.4", "198.51.100.7, 10.0.0.2"], "198.51.100.7"),
+    # Fewer entries than proxies: the request went around them
+    (2, ["198.51.100.7"], "10.0.0.1"),
+    (1, [], "10.0.0.1"),
+])
+def test_forwarded_for_trusts_only_our_proxy_hops(monkeypatch, hops, forwarded, expected):
+    monkeypatch.setattr(server, "TRUSTED_PROXY_HOPS", hops)
+    assert server.client_ip(scope(*forwarded)) == expected
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    """Sets one admission limit for the test: limits(route_class, name, value)."""
+    return lambda route_class, name, value: monkeypatch.setitem(server.ADMISSION_LIMITS[route_class], name, value)
+
+
+@pytest.mark.anyio
+async def test_user_bucket_is_shared_by_all_of_a_users_credentials(api, database, limits):
+    limits("default", "user_rate", 0.001)
+    limits("default", "user_burst", 2)
+    headers = await register(api)
+    me = (await api.get("/api/auth/me", headers=headers)).json()
+    await database.user_sessions.insert_one({
+        "user_id": me["user_id"],
+        "session_token": "session_second_device",
+        "expires_at": datetime.now(timezone.utc) + timedelta(days=1),
+    })
+
+    # The first /auth/me above took one token; a second credential of the
+    # same user draws from the same bucket
+    assert (await api.get("/api/lists", headers=headers)).status_code == 200
+    limited = await api.get("/api/lists", cookies={"session_token": "session_second_device"})
+    assert limited.status_code == 429
+    assert int(limited.headers["Retry-After"]) > 0
+    assert server.admission.rejected[("default", "user_rate")] == 1
+
+
+@pytest.mark.anyio
+async def test_ip_buckets_are_off_unless_client_addresses_are_known(api, limits, monkeypatch):
+    limits("auth", "ip_burst", 1)
+    for i in range(3):
+        await register(api, f"user{i}@example.com")
+
+    monkeypatch.setattr(server, "ADMISSION_IP_LIMITS", True)
+    assert (await api.post("/api/auth/login", json={"email": "user0@example.com", "password": "secret123"})).status_code == 200
+    assert (await api.post("/api/auth/login", json={"email": "user0@example.com", "password": "secret123"})).status_code == 429
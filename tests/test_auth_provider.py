@@ -0,0 +1,113 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+SESSION = {"email": "oauth@example.com", "name": "OAuth User", "picture": None, "session_token": "token_1"}
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(server, "AUTH_PROVIDER_BACKOFF_SECONDS", 0)
+
+
+@pytest.fixture
+async def provider():
+    """Builds an AuthProviderClient answering from `answers` in turn, logging each call."""
+    clients = []
+
+    def build(*answers, retries=2, failures=2, reset_seconds=30):
+        calls = []
+
+        async def handler(request):
+            calls.append(request.headers["X-Session-ID"])
+            answer = answers[min(len(calls), len(answers)) - 1]
+            if isinstance(answer, Exception):
+                raise answer
+            await asyncio.sleep(0.01)
+            return httpx.Response(answer, json=SESSION if answer == 200 else {})
+
+        client = server.AuthProviderClient(
+            "http://provider.test/session-data", 1, retries, 4,
+            server.CircuitBreaker(failures, reset_seconds), transport=httpx.MockTransport(handler)
+        )
+        clients.append(client)
+        return client, calls
+
+    yield build
+    for client in clients:
+        await client.close()
+
+
+async def test_server_errors_and_transport_failures_are_retried(provider):
+    client, calls = provider(503, httpx.ConnectError("refused"), 200)
+    assert await client.fetch_session("sess_1") == SESSION
+    assert len(calls) == 3
+    assert client.breaker.state == "closed"
+
+
+async def test_rejected_session_is_not_retried(provider):
+    client, calls = provider(401)
+    assert await client.fetch_session("sess_1") is None
+    assert len(calls) == 1
+
+
+async def test_breaker_opens_after_repeated_failures(provider):
+    client, calls = provider(500, retries=0, failures=2)
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            await client.fetch_session("sess_1")
+    assert client.breaker.state == "open"
+
+    with pytest.raises(HTTPException) as failed:
+        await client.fetch_session("sess_1")
+    assert failed.value.status_code == 503
+    assert int(failed.value.headers["Retry-After"]) > 0
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize("probe, state", [(200, "closed"), (500, "open")])
+async def test_half_open_breaker_lets_one_probe_decide(provider, probe, state):
+    client, calls = provider(500, probe, retries=0, failures=1, reset_seconds=30)
+    with pytest.raises(HTTPException):
+        await client.fetch_session("sess_1")
+    client.breaker.opened_at -= 30
+    assert client.breaker.state == "half-open"
+
+    probing = asyncio.create_task(client.fetch_session("sess_2"))
+    await asyncio.sleep(0)
+    # Only the probe goes through while it is in flight
+    with pytest.raises(HTTPException):
+        await client.fetch_session("sess_3")
+    if probe == 200:
+        assert await probing == SESSION
+    else:
+        with pytest.raises(HTTPException):
+            await probing
+    assert client.breaker.state == state
+    assert calls == ["sess_1", "sess_2"]
+
+
+async def test_duplicate_callbacks_exchange_the_session_once(api, database, provider, monkeypatch):
+    client, calls = provider(200)
+    monkeypatch.setattr(server, "auth_provider", client)
+
+    first, second = await asyncio.gather(*(
+        api.post("/api/auth/session", json={"session_id": "sess_1"}) for _ in range(2)
+    ))
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    assert calls == ["sess_1"]
+    assert await database.user_sessions.count_documents({}) == 1
+
+    # A failed exchange is forgotten, so the next callback tries again
+    failing, calls = provider(401)
+    monkeypatch.setattr(server, "auth_provider", failing)
+    for _ in range(2):
+        assert (await api.post("/api/auth/session", json={"session_id": "sess_2"})).status_code == 401
+    assert calls == ["sess_2", "sess_2"]
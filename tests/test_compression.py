@@ -0,0 +1,39 @@
+import gzip
+import json
+
+import pytest
+
+import server
+
+from .conftest import register
+
+pytestmark = pytest.mark.anyio
+
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br"])
+def test_decompressor_stops_one_buffer_past_the_limit(encoding):
+    if encoding == "br" and not server.BROTLI_BOUNDED_DECOMPRESS:
+        pytest.skip("installed brotli cannot bound its output")
+    bomb = b"\0" * (64 * 1024 * 1024)
+    data = gzip.compress(bomb) if encoding == "gzip" else server.brotli.compress(bomb)
+
+    out = server._Decompressor(encoding).decompress(data, 1024)
+    assert 1024 < len(out) < 1024 * 1024
+
+
+async def test_compressed_request_body_is_inflated(api):
+    headers = await register(api)
+    body = gzip.compress(json.dumps({"name": "Weekly"}).encode())
+
+    response = await api.post("/api/lists", content=body, headers={**headers, "Content-Encoding": "gzip", "Content-Type": "application/json"})
+    assert response.status_code == 200 and response.json()["name"] == "Weekly"
+
+
+async def test_request_body_over_the_inflated_limit_is_rejected(api, monkeypatch):
+    headers = await register(api)
+    monkeypatch.setattr(server, "MAX_DECOMPRESSED_BODY_BYTES", 1024)
+    body = gzip.compress(json.dumps({"name": "x" * 4096}).encode())
+
+    response = await api.post("/api/lists", content=body, headers={**headers, "Content-Encoding": "gzip", "Content-Type": "application/json"})
+    assert response.status_code == 413
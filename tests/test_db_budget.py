@@ -0,0 +1,90 @@
+import pytest
+
+import server
+
+from .conftest import register
+from .db_budget import PROFILE_HEADER, allow_profile_header, assert_db_budget, db_calls, report_mock_commands
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def weekly(api, monkeypatch):
+    """Auth headers asking for a profile, and a list holding five items.
+
+    Migrations count as run, as they have on a started server.
+    """
+    for version, _, _ in server.MIGRATIONS:
+        server.migration_status.mark_applied(version)
+    headers = await register(api)
+    lst = (await api.post("/api/lists", json={"name": "Weekly"}, headers=headers)).json()
+    for i in range(5):
+        await api.post(f"/api/lists/{lst['id']}/items", json={"name": f"item {i}"}, headers=headers)
+    report_mock_commands(monkeypatch)
+    allow_profile_header(monkeypatch)
+    return {**headers, **PROFILE_HEADER}, f"/api/lists/{lst['id']}/items"
+
+
+async def test_list_reads_stay_within_budget(api, weekly):
+    headers, items_url = weekly
+    assert_db_budget(await api.get("/api/lists", headers=headers), 2)
+    assert_db_budget(await api.get("/api/lists", params={"include": "stats"}, headers=headers), 3)
+
+    items = await api.get(items_url, headers=headers)
+    assert_db_budget(items, 1)
+    not_modified = await api.get(items_url, headers={**headers, "If-None-Match": items.headers["ETag"]})
+    assert not_modified.status_code == 304
+    assert_db_budget(not_modified, 1)
+
+
+async def test_item_writes_stay_within_budget(api, weekly):
+    headers, items_url = weekly
+    # Each write: reserve and release its change version, the item write
+    # and the list bump; renames also re-index the item, deletes add a
+    # tombstone. A create takes its order in the list bump
+    created = await api.post(items_url, json={"name": "milk"}, headers=headers)
+    assert_db_budget(created, 4)
+    item_url = f"{items_url}/{created.json()['id']}"
+    assert_db_budget(await api.put(item_url, json={"is_done": True}, headers=headers), 4)
+    assert_db_budget(await api.put(item_url, json={"name": "oat milk"}, headers=headers), 5)
+    assert_db_budget(await api.delete(item_url, headers=headers), 5)
+
+
+async def test_bulk_actions_stay_within_budget(api, weekly):
+    headers, items_url = weekly
+    list_url = items_url.rsplit("/", 1)[0]
+    # Reserve, the filtered update, the list bump, release
+    assert_db_budget(await api.post(f"{list_url}/mark-all-done", headers=headers), 4)
+    # Read the done items, reserve, delete, tombstones, the list bump, release
+    assert_db_budget(await api.post(f"{list_url}/clear-done", headers=headers), 6)
+    # Nothing done: the read and the list lookup that tells empty from missing
+    assert_db_budget(await api.post(f"{list_url}/clear-done", headers=headers), 2)
+
+
+async def test_sync_round_trips_do_not_grow_with_the_push(api, weekly):
+    headers, items_url = weekly
+    list_id = items_url.split("/")[3]
+
+    async def push(count: int, prefix: str):
+        items = [{"id": f"item_{prefix}{i}", "list_id": list_id, "name": f"{prefix} {i}"} for i in range(count)]
+        response = await api.post("/api/sync", json={"lists": [], "items": items, "since_version": 0}, headers=headers)
+        assert response.status_code == 200, response.text
+        return response
+
+    small, large = await push(2, "a"), await push(50, "b")
+    assert db_calls(large) == db_calls(small)
+    assert_db_budget(large, 16)
+
+    delta = await api.post("/api/sync", json={"lists": [], "items": [], "since_version": large.json()["version"]}, headers=headers)
+    assert_db_budget(delta, 4)
+
+
+@pytest.mark.parametrize("token, sent", [(None, PROFILE_HEADER["X-DB-Profile"]), ("db-budget", "guess"), (None, "1")])
+async def test_profile_headers_need_the_profile_token(api, monkeypatch, token, sent):
+    monkeypatch.setattr(server, "DB_PROFILE_TOKEN", token)
+    headers = await register(api)
+
+    response = await api.get("/api/lists", headers={**headers, "X-DB-Profile": sent})
+    assert response.status_code == 200
+    assert "X-DB-Calls" not in response.headers
+    assert "Server-Timing" not in response.headers
@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+import server
+
+from .conftest import register
+
+pytestmark = pytest.mark.anyio
+
+EXPORT = {
+    "version": 2,
+    "exported_at": "2024-05-01T10:00:00+00:00",
+    "meta": {"lists": [{"id": "not a record"}], "items": [1, 2]},
+    "lists": [{"id": "l1", "name": "خبز وحليب", "tags": ["a", {"b": [1, 2]}]}, "stray", 7],
+    "items": [
+        {"id": "i1", "list_id": "l1", "name": "bread", "quantity": 2.5},
+        {"id": "i2", "list_id": "l1", "name": "milk, \"full\" [1L]", "quantity": 10},
+    ],
+    "trailer": [{"id": "ignored"}],
+}
+
+EXPECTED = [("list", EXPORT["lists"][0]), ("item", EXPORT["items"][0]), ("item", EXPORT["items"][1])]
+
+
+def parse(chunks) -> list:
+    parser = server._JSONImportParser()
+    records = []
+    for chunk in chunks:
+        records.extend(parser.feed(chunk))
+    records.extend(parser.feed("", final=True))
+    return records
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_json_parser_reads_records_one_character_at_a_time(indent):
+    assert parse(json.dumps(EXPORT, ensure_ascii=False, indent=indent)) == EXPECTED
+
+
+@pytest.mark.parametrize("size", [2, 3, 7, 64])
+def test_json_parser_handles_any_chunk_boundary(size):
+    text = json.dumps(EXPORT, ensure_ascii=False)
+    assert parse(text[i:i + size] for i in range(0, len(text), size)) == EXPECTED
+
+
+def test_json_parser_waits_for_numbers_split_across_chunks():
+    assert parse(['{"items": [{"quantity": 1', '25}], "version": 3', '0}']) == [("item", {"quantity": 125})]
+
+
+def test_json_parser_yields_records_as_they_complete():
+    parser = server._JSONImportParser()
+    assert parser.feed('{"lists": [{"id": "a"}, {"id": ') == [("list", {"id": "a"})]
+    assert parser.feed('"b"}]}') == [("list", {"id": "b"})]
+    assert parser.feed("", final=True) == []
+
+
+@pytest.mark.parametrize("text", ['{"lists": [{"id": "a"}', '{"lists": [{"id": "a"}]', '[{"id": "a"}]', '{"lists" [] }'])
+def test_json_parser_rejects_malformed_or_truncated_data(text):
+    with pytest.raises(ValueError):
+        parse([text])
+
+
+def test_json_parser_caps_the_record_size(monkeypatch):
+    monkeypatch.setattr(server, "IMPORT_MAX_RECORD_BYTES", 100)
+    parser = server._JSONImportParser()
+    assert parser.feed('{"items": [{"name": "' + "x" * 50 + '"}, ') == [("item", {"name": "x" * 50})]
+    with pytest.raises(ValueError, match="too large"):
+        for _ in range(10):
+            parser.feed('{"name": "' + "x" * 20)
+
+
+async def test_import_accepts_a_body_sent_byte_by_byte(api):
+    headers = await register(api)
+    body = json.dumps(EXPORT, ensure_ascii=False).encode()
+
+    async def byte_by_byte():
+        for i in range(len(body)):
+            yield body[i:i + 1]
+
+    response = await api.post("/api/import", content=byte_by_byte(), headers={**headers, "Content-Type": "application/json"})
+    assert response.status_code == 200, response.text
+    assert (response.json()["lists_imported"], response.json()["items_imported"]) == (1, 2)
+
+    lists = (await api.get("/api/lists", headers=headers)).json()
+    assert [lst["name"] for lst in lists] == ["خبز وحليب"]
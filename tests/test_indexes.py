@@ -0,0 +1,31 @@
+import pytest
+
+import server
+
+from .conftest import register
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_startup_check_requires_the_unique_email_index(database):
+    with pytest.raises(RuntimeError, match="users.email_unique"):
+        await server.check_required_indexes()
+
+    assert await server.ensure_indexes() == []
+    await server.check_required_indexes()
+
+
+async def test_duplicate_emails_block_the_index_and_the_check(database):
+    await database.users.insert_many([{"user_id": "user_a", "email": "a@example.com"}, {"user_id": "user_b", "email": "a@example.com"}])
+
+    assert await server.ensure_indexes() == ["users.email_unique"]
+    with pytest.raises(RuntimeError, match="users.email_unique"):
+        await server.check_required_indexes()
+
+
+async def test_register_rejects_a_taken_email(api):
+    await server.ensure_indexes()
+    await register(api, "taken@example.com")
+
+    response = await api.post("/api/auth/register", json={"email": "taken@example.com", "password": "secret123", "name": "Other"})
+    assert response.status_code == 400
@@ -0,0 +1,157 @@
+import asyncio
+
+import pytest
+
+import server
+
+from .conftest import register
+
+pytestmark = pytest.mark.anyio
+
+
+async def legacy_item(database, list_id: str):
+    """An item written before items carried their owner's user_id."""
+    await database.items.insert_one({"id": "item_legacy", "list_id": list_id, "name": "milk", "order": 0})
+
+
+async def test_items_without_owner_are_backfilled_until_migration_4(api, database):
+    headers = await register(api)
+    lst = (await api.post("/api/lists", json={"name": "Weekly"}, headers=headers)).json()
+    await legacy_item(database, lst["id"])
+
+    response = await api.get(f"/api/lists/{lst['id']}/items", headers=headers)
+    assert [item["id"] for item in response.json()] == ["item_legacy"]
+    assert (await database.items.find_one({"id": "item_legacy"}))["user_id"]
+
+
+async def test_empty_list_read_skips_backfill_once_migration_4_ran(api, database):
+    headers = await register(api)
+    lst = (await api.post("/api/lists", json={"name": "Weekly"}, headers=headers)).json()
+    await database.migrations.insert_one({"_id": 4})
+    await legacy_item(database, lst["id"])
+
+    response = await api.get(f"/api/lists/{lst['id']}/items", headers=headers)
+    assert response.json() == []
+    assert "user_id" not in await database.items.find_one({"id": "item_legacy"})
+
+
+async def test_tags_read_during_an_item_write_go_stale_once_it_lands(api, monkeypatch):
+    headers = await register(api)
+    lst = (await api.post("/api/lists", json={"name": "Weekly"}, headers=headers)).json()
+
+    entered, proceed = asyncio.Event(), asyncio.Event()
+    allocate_item_order = server.allocate_item_order
+
+    async def stalled(*args):
+        order = await allocate_item_order(*args)
+        entered.set()
+        await proceed.wait()
+        return order
+
+    # Read both tags after the create has its order but before its insert
+    monkeypatch.setattr(server, "allocate_item_order", stalled)
+    create = asyncio.create_task(api.post(f"/api/lists/{lst['id']}/items", json={"name": "milk"}, headers=headers))
+    await entered.wait()
+    items_tag = (await api.get(f"/api/lists/{lst['id']}/items", headers=headers)).headers["ETag"]
+    lists_tag = (await api.get("/api/lists", headers=headers)).headers["ETag"]
+
+    proceed.set()
+    assert (await create).status_code == 200
+    items = await api.get(f"/api/lists/{lst['id']}/items", headers={**headers, "If-None-Match": items_tag})
+    assert items.status_code == 200 and [item["name"] for item in items.json()] == ["milk"]
+    lists = await api.get("/api/lists", headers={**headers, "If-None-Match": lists_tag})
+    assert lists.status_code == 200
+
+
+async def test_quick_adds_get_consecutive_orders_and_bump_the_list(api):
+    headers = await register(api)
+    lst = (await api.post("/api/lists", json={"name": "Weekly"}, headers=headers)).json()
+    created = await asyncio.gather(*(
+        api.post(f"/api/lists/{lst['id']}/items", json={"name": f"item {i}"}, headers=headers) for i in range(5)
+    ))
+    assert sorted(response.json()["order"] for response in created) == [0, 1, 2, 3, 4]
+
+    bumped = (await api.get(f"/api/lists/{lst['id']}", headers=headers)).json()
+    assert bumped["version"] == max(response.json()["version"] for response in created)
+
+
+async def test_bulk_actions_touch_only_the_owners_items(api, database):
+    headers = await register(api)
+    lst = (await api.post("/api/lists", json={"name": "Weekly"}, headers=headers)).json()
+    for name in ("milk", "bread"):
+        await api.post(f"/api/lists/{lst['id']}/items", json={"name": name}, headers=headers)
+    stranger = await register(api, "stranger@example.com")
+
+    for action in ("mark-all-done", "clear-done"):
+        response = await api.post(f"/api/lists/{lst['id']}/{action}", headers=stranger)
+        assert response.status_code == 404
+    assert await database.items.count_documents({"is_done": True}) == 0
+
+    assert (await api.post(f"/api/lists/{lst['id']}/mark-all-done", headers=headers)).status_code == 200
+    assert (await api.post(f"/api/lists/{lst['id']}/clear-done", headers=headers)).status_code == 200
+    assert (await api.get(f"/api/lists/{lst['id']}/items", headers=headers)).json() == []
+    assert (await api.post(f"/api/lists/{lst['id']}/clear-done", headers=headers)).status_code == 200
+
+
+async def test_bulk_actions_reach_items_without_owner_before_migration_4(api, database):
+    headers = await register(api)
+    lst = (await api.post("/api/lists", json={"name": "Weekly"}, headers=headers)).json()
+    await legacy_item(database, lst["id"])
+
+    assert (await api.post(f"/api/lists/{lst['id']}/mark-all-done", headers=headers)).status_code == 200
+    assert (await database.items.find_one({"id": "item_legacy"}))["is_done"] is True
+    assert (await api.post(f"/api/lists/{lst['id']}/clear-done", headers=headers)).status_code == 200
+    assert await database.items.count_documents({}) == 0
+
+
+async def batch(api, headers, list_id: str, *operations):
+    response = await api.post(f"/api/lists/{list_id}/items/batch", json={"operations": list(operations)}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def test_batch_replays_operations_in_order(api, database):
+    headers = await register(api)
+    lst = (await api.post("/api/lists", json={"name": "Weekly"}, headers=headers)).json()
+    milk, bread = [
+        (await api.post(f"/api/lists/{lst['id']}/items", json={"name": name}, headers=headers)).json()
+        for name in ("milk", "bread")
+    ]
+
+    body = await batch(
+        api, headers, lst["id"],
+        {"op": "delete", "id": milk["id"]},
+        {"op": "update", "id": milk["id"], "data": {"name": "oat milk"}},
+        {"op": "update", "id": bread["id"], "data": {"name": "rye bread"}},
+        {"op": "update", "id": bread["id"], "data": {"is_done": True}},
+        {"op": "create", "data": {"name": "eggs"}},
+        {"op": "delete", "id": milk["id"]},
+    )
+    assert [(result["op"], result["status"]) for result in body["results"]] == [
+        ("delete", "deleted"), ("update", "not_found"), ("update", "updated"),
+        ("update", "updated"), ("create", "created"), ("delete", "not_found"),
+    ]
+    assert [(item["name"], item["is_done"]) for item in body["items"]] == [("rye bread", True), ("eggs", False)]
+    assert await database.items.find_one({"id": milk["id"]}) is None
+
+    items = (await api.get(f"/api/lists/{lst['id']}/items", headers=headers)).json()
+    assert [(item["name"], item["is_done"]) for item in items] == [("rye bread", True), ("eggs", False)]
+
+
+async def test_batch_update_then_delete_leaves_only_a_tombstone(api, database):
+    headers = await register(api)
+    lst = (await api.post("/api/lists", json={"name": "Weekly"}, headers=headers)).json()
+    milk = (await api.post(f"/api/lists/{lst['id']}/items", json={"name": "milk"}, headers=headers)).json()
+    since = (await api.post("/api/sync", json={"lists": [], "items": [], "since_version": 0}, headers=headers)).json()["version"]
+
+    body = await batch(
+        api, headers, lst["id"],
+        {"op": "update", "id": milk["id"], "data": {"name": "oat milk"}},
+        {"op": "delete", "id": milk["id"]},
+    )
+    assert [result["status"] for result in body["results"]] == ["updated", "deleted"]
+    assert body["items"] == []
+
+    delta = (await api.post("/api/sync", json={"lists": [], "items": [], "since_version": since}, headers=headers)).json()
+    assert delta["items"] == []
+    assert [tombstone["id"] for tombstone in delta["deleted"]] == [milk["id"]]
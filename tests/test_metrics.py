@@ -0,0 +1,25 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("token, public, sent, status", [
+    (None, False, None, 404),
+    (None, True, None, 200),
+    ("scrape", False, None, 401),
+    ("scrape", False, "guess", 401),
+    ("scrape", False, "scrape", 200),
+    # A token protects the endpoint even if it was also marked public
+    ("scrape", True, None, 401),
+])
+async def test_metrics_need_the_token_unless_public(api, monkeypatch, token, public, sent, status):
+    monkeypatch.setattr(server, "METRICS_TOKEN", token)
+    monkeypatch.setattr(server, "METRICS_PUBLIC", public)
+    headers = {"Authorization": f"Bearer {sent}"} if sent else {}
+
+    response = await api.get("/metrics", headers=headers)
+    assert response.status_code == status
+    if status == 200:
+        assert "http_request_duration_seconds" in response.text
@@ -0,0 +1,60 @@
+import pytest
+
+from .conftest import register
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def items(api):
+    """Headers, the list's items URL and {name: id} for items i0..i3 at orders 0..3."""
+    headers = await register(api)
+    lst = (await api.post("/api/lists", json={"name": "Weekly"}, headers=headers)).json()
+    url = f"/api/lists/{lst['id']}/items"
+    ids = {}
+    for i in range(4):
+        ids[f"i{i}"] = (await api.post(url, json={"name": f"i{i}"}, headers=headers)).json()["id"]
+    return headers, url, ids
+
+
+async def move(api, items, name, **neighbours):
+    headers, url, ids = items
+    body = {key: ids[value] for key, value in neighbours.items()}
+    return await api.post(f"{url}/{ids[name]}/move", json=body, headers=headers)
+
+
+async def names(api, items) -> list:
+    headers, url, _ = items
+    return [item["name"] for item in (await api.get(url, headers=headers)).json()]
+
+
+@pytest.mark.parametrize("name, neighbours, expected", [
+    # One neighbour: the other side is whatever is next to it now
+    ("i0", {"after_id": "i1"}, ["i1", "i0", "i2", "i3"]),
+    ("i3", {"before_id": "i1"}, ["i0", "i3", "i1", "i2"]),
+    ("i0", {"after_id": "i3"}, ["i1", "i2", "i3", "i0"]),
+    ("i3", {"before_id": "i0"}, ["i3", "i0", "i1", "i2"]),
+    # The moved item is skipped when looking for the neighbour's neighbour
+    ("i1", {"after_id": "i0"}, ["i0", "i1", "i2", "i3"]),
+    ("i0", {"after_id": "i1", "before_id": "i2"}, ["i1", "i0", "i2", "i3"]),
+])
+async def test_move_places_the_item_between_its_neighbours(api, items, name, neighbours, expected):
+    response = await move(api, items, name, **neighbours)
+    assert response.status_code == 200, response.text
+    assert await names(api, items) == expected
+
+
+async def test_move_between_equal_orders_renumbers_first(api, database, items):
+    _, _, ids = items
+    await database.items.update_many({"id": {"$in": [ids["i1"], ids["i2"]]}}, {"$set": {"order": 1}})
+    # Tied orders fall back to id order
+    first, second = sorted(["i1", "i2"], key=ids.get)
+
+    assert (await move(api, items, "i3", after_id=first, before_id=second)).status_code == 200
+    assert await names(api, items) == ["i0", first, "i3", second]
+
+
+async def test_move_rejects_reversed_neighbours(api, items):
+    response = await move(api, items, "i0", after_id="i2", before_id="i1")
+    assert response.status_code == 400
+    assert await names(api, items) == ["i0", "i1", "i2", "i3"]
@@ -0,0 +1,82 @@
+import base64
+import json
+
+import pytest
+
+import server
+
+from .conftest import register
+
+pytestmark = pytest.mark.anyio
+
+
+def raw_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+async def pages(api, url, headers, limit, key) -> list:
+    """Every row of a paginated endpoint, following next_cursor."""
+    rows, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = await api.get(url, params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        page = response.json()
+        assert len(page[key]) <= limit
+        rows += page[key]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return rows
+
+
+async def test_lists_page_by_most_recently_updated(api):
+    headers = await register(api)
+    created = [(await api.post("/api/lists", json={"name": f"List {i}"}, headers=headers)).json()["id"] for i in range(5)]
+
+    rows = await pages(api, "/api/lists", headers, 2, "lists")
+    assert [row["id"] for row in rows] == created[::-1]
+
+
+async def test_items_page_in_list_order(api):
+    headers = await register(api)
+    lst = (await api.post("/api/lists", json={"name": "Weekly"}, headers=headers)).json()
+    url = f"/api/lists/{lst['id']}/items"
+    for i in range(7):
+        await api.post(url, json={"name": f"item {i}"}, headers=headers)
+
+    rows = await pages(api, url, headers, 3, "items")
+    assert [row["name"] for row in rows] == [f"item {i}" for i in range(7)]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64 json",
+    raw_cursor({"a": 1}),
+    raw_cursor(["2024-01-01T00:00:00+00:00"]),
+    raw_cursor([1, "list_x"]),
+    raw_cursor(["notadate", "list_x"]),
+    raw_cursor(["2024-01-01T00:00:00+00:00", {"$gt": ""}]),
+])
+async def test_malformed_list_cursors_are_rejected(api, cursor):
+    headers = await register(api)
+    response = await api.get("/api/lists", params={"cursor": cursor}, headers=headers)
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("cursor", [
+    raw_cursor([{"$gt": 0}, "item_x"]),
+    raw_cursor(["3", "item_x"]),
+    raw_cursor([True, "item_x"]),
+    raw_cursor([1, ["item_x"]]),
+    server.encode_cursor(1, "item_x", 2),
+])
+async def test_malformed_item_cursors_are_rejected(api, cursor):
+    headers = await register(api)
+    lst = (await api.post("/api/lists", json={"name": "Weekly"}, headers=headers)).json()
+    response = await api.get(f"/api/lists/{lst['id']}/items", params={"cursor": cursor}, headers=headers)
+    assert response.status_code == 400
+
+
+async def test_page_limits_are_bounded(api):
+    headers = await register(api)
+    for limit in (0, server.MAX_PAGE_SIZE + 1):
+        assert (await api.get("/api/lists", params={"limit": limit}, headers=headers)).status_code == 400
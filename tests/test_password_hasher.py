@@ -0,0 +1,34 @@
+import asyncio
+import threading
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_cancelled_call_leaves_the_queue():
+    hasher = server.PasswordHasher(1)
+    started, release = threading.Event(), threading.Event()
+
+    def blocking():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    running = asyncio.create_task(hasher._run(blocking))
+    await asyncio.to_thread(started.wait, 5)
+    waiting = asyncio.create_task(hasher._run(blocking))
+    await asyncio.sleep(0)
+    assert hasher.stats()["queued"] == 1
+
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    release.set()
+    assert await running == "done"
+
+    stats = hasher.stats()
+    assert (stats["queued"], stats["running"], stats["calls"]) == (0, 0, 1)
+    hasher.shutdown()
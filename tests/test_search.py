@@ -0,0 +1,78 @@
+import pytest
+
+import server
+
+from .conftest import register
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("value, words", [
+    ("الخبز الأبيض", ["الخبز", "الابيض"]),
+    (5, ["5"]),
+    (2.5, ["2", "5"]),
+    (True, []),
+    ({"a": 1}, []),
+    (None, []),
+])
+def test_normalize_search_text_accepts_any_stored_value(value, words):
+    assert server.normalize_search_text(value) == words
+
+
+async def test_search_ranks_items_without_returning_the_index(api):
+    headers = await register(api)
+    lst = (await api.post("/api/lists", json={"name": "Weekly"}, headers=headers)).json()
+    for name, note in [("bread", None), ("milk", "bread crumbs"), ("bread rolls", None)]:
+        await api.post(f"/api/lists/{lst['id']}/items", json={"name": name, "note": note}, headers=headers)
+
+    response = await api.get("/api/search", params={"q": "bread"}, headers=headers)
+    items = response.json()["items"]
+    assert [item["name"] for item in items][-1] == "milk"
+    assert {"bread", "bread rolls"} == {item["name"] for item in items[:2]}
+    assert not any(field in item for item in items for field in (*server.SEARCH_FIELDS, "_score"))
+
+
+@pytest.mark.parametrize("q", ["خبز", "الخبز", "خب"])
+async def test_search_folds_the_arabic_article_on_both_sides(api, q):
+    headers = await register(api)
+    lst = (await api.post("/api/lists", json={"name": "Weekly"}, headers=headers)).json()
+    for name in ["خبز", "الخبز الأبيض"]:
+        await api.post(f"/api/lists/{lst['id']}/items", json={"name": name}, headers=headers)
+
+    found = (await api.get("/api/search", params={"q": q}, headers=headers)).json()["items"]
+    assert {item["name"] for item in found} == {"خبز", "الخبز الأبيض"}
+
+
+async def test_sync_indexes_non_text_fields(api):
+    headers = await register(api)
+    body = {
+        "lists": [{"id": "list_synced", "name": "Synced"}],
+        "items": [{"id": "item_synced", "list_id": "list_synced", "name": "eggs", "note": 12}],
+    }
+    response = await api.post("/api/sync", json=body, headers=headers)
+    assert response.status_code == 200, response.text
+
+    found = (await api.get("/api/search", params={"q": "12"}, headers=headers)).json()["items"]
+    assert [item["id"] for item in found] == ["item_synced"]
+
+
+async def test_import_indexes_numeric_names(api):
+    headers = await register(api)
+    export = {"lists": [{"id": "a", "name": 2024}], "items": [{"list_id": "a", "name": 7}]}
+    response = await api.post("/api/import", json=export, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["items_imported"] == 1
+
+
+async def test_failed_import_is_rolled_back(api, database, monkeypatch):
+    headers = await register(api)
+
+    async def fail(self):
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(server._ImportWriter, "_touch_filled_lists", fail)
+    export = {"lists": [{"id": "a", "name": "Imported"}], "items": [{"list_id": "a", "name": "milk"}]}
+    with pytest.raises(RuntimeError):
+        await api.post("/api/import", json=export, headers=headers)
+    assert await database.shopping_lists.count_documents({}) == 0
+    assert await database.items.count_documents({}) == 0
@@ -0,0 +1,64 @@
+import logging
+
+import pytest
+from starlette.requests import Request
+
+import server
+
+from .conftest import register
+
+pytestmark = pytest.mark.anyio
+
+
+def stream_request(query: bytes) -> Request:
+    return Request({"type": "http", "method": "GET", "path": "/api/stream", "query_string": query, "headers": []})
+
+
+async def test_stream_ticket_opens_stream(api):
+    headers = await register(api)
+    response = await api.post("/api/stream/ticket", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["expires_in"] == server.STREAM_TICKET_SECONDS
+
+    ticket = response.json()["ticket"]
+    user = await server.get_stream_user(stream_request(b"ticket=" + ticket.encode()), ticket=ticket, credentials=None)
+    assert user["email"] == "user@example.com"
+
+
+async def test_login_token_is_not_taken_from_the_url(api):
+    headers = await register(api)
+    token = headers["Authorization"].split()[1]
+
+    assert (await api.get("/api/stream", params={"token": token})).status_code == 401
+    response = await api.get("/api/stream", params={"ticket": token})
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Invalid ticket"
+
+
+async def test_stream_ticket_is_not_a_login_token(api):
+    headers = await register(api)
+    ticket = (await api.post("/api/stream/ticket", headers=headers)).json()["ticket"]
+
+    response = await api.get("/api/lists", headers={"Authorization": f"Bearer {ticket}"})
+    assert response.status_code == 401
+
+
+@pytest.mark.parametrize("media_type, timed", [("text/event-stream", False), ("application/json", True)])
+async def test_event_streams_are_not_timed(monkeypatch, caplog, media_type, timed):
+    monkeypatch.setattr(server, "DB_PROFILE_SLOW_MS", 0)
+
+    async def endpoint(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", media_type.encode())]})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    app = server.DBProfilerMiddleware(server.MetricsMiddleware(endpoint))
+    labels = ("GET", "unmatched")
+    before = server.http_latency.count(labels)
+    with caplog.at_level(logging.WARNING):
+        await app({"type": "http", "method": "GET", "path": "/api/stream", "headers": []}, None, send)
+
+    assert server.http_latency.count(labels) - before == int(timed)
+    assert ("Slow request" in caplog.text) == timed
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+import server
+
+from .conftest import register
+
+pytestmark = pytest.mark.anyio
+
+
+async def delta(api, headers, since: int) -> dict:
+    response = await api.post("/api/sync", json={"lists": [], "items": [], "since_version": since}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def test_delta_sync_returns_changes_and_tombstones(api):
+    headers = await register(api)
+    lst = (await api.post("/api/lists", json={"name": "Weekly"}, headers=headers)).json()
+    item = (await api.post(f"/api/lists/{lst['id']}/items", json={"name": "milk"}, headers=headers)).json()
+    since = (await delta(api, headers, 0))["version"]
+
+    await api.put(f"/api/lists/{lst['id']}/items/{item['id']}", json={"is_done": True}, headers=headers)
+    await api.delete(f"/api/lists/{lst['id']}/items/{item['id']}", headers=headers)
+
+    changes = await delta(api, headers, since)
+    assert [(tomb["kind"], tomb["id"]) for tomb in changes["deleted"]] == [("item", item["id"])]
+    assert changes["version"] > since
+    assert (await delta(api, headers, changes["version"]))["deleted"] == []
+
+
+async def test_sync_version_never_passes_a_write_in_flight(api, monkeypatch):
+    headers = await register(api)
+    lst = (await api.post("/api/lists", json={"name": "Weekly"}, headers=headers)).json()
+
+    entered, proceed = asyncio.Event(), asyncio.Event()
+    allocate_item_order = server.allocate_item_order
+
+    async def stalled(*args):
+        entered.set()
+        await proceed.wait()
+        return await allocate_item_order(*args)
+
+    # The first create holds its version while its insert is stalled; a
+    # second create reserves and writes a later version meanwhile
+    monkeypatch.setattr(server, "allocate_item_order", stalled)
+    slow = asyncio.create_task(api.post(f"/api/lists/{lst['id']}/items", json={"name": "milk"}, headers=headers))
+    await entered.wait()
+    monkeypatch.setattr(server, "allocate_item_order", allocate_item_order)
+    fast = await api.post(f"/api/lists/{lst['id']}/items", json={"name": "bread"}, headers=headers)
+    assert fast.status_code == 200
+
+    during = await delta(api, headers, 0)
+    assert during["version"] < fast.json()["version"]
+
+    proceed.set()
+    assert (await slow).status_code == 200
+    after = await delta(api, headers, during["version"])
+    assert {item["name"] for item in after["items"]} == {"milk", "bread"}
+
+
+async def test_failed_write_releases_its_version(api):
+    headers = await register(api)
+    response = await api.post("/api/lists/list_missing/items", json={"name": "milk"}, headers=headers)
+    assert response.status_code == 404
+
+    lst = (await api.post("/api/lists", json={"name": "Weekly"}, headers=headers)).json()
+    assert (await delta(api, headers, 0))["version"] == lst["version"]
+
+
+async def test_full_sync_returns_every_list_and_item(api):
+    headers = await register(api)
+    lists = [{"id": f"list_{i}", "name": f"List {i}"} for i in range(120)]
+    items = [{"id": f"item_{i}", "list_id": f"list_{i % 120}", "name": f"item {i}"} for i in range(1100)]
+    response = await api.post("/api/sync", json={"lists": lists, "items": items}, headers=headers)
+    assert response.status_code == 200, response.text
+
+    full = response.json()
+    assert full["full"] is True
+    assert len(full["lists"]) == 120 and len(full["items"]) == 1100
+
+
+async def test_push_does_not_bring_back_deletes_from_another_device(api):
+    headers = await register(api)
+    lst = (await api.post("/api/lists", json={"name": "Weekly"}, headers=headers)).json()
+    base = f"/api/lists/{lst['id']}/items"
+    kept = (await api.post(base, json={"name": "milk"}, headers=headers)).json()
+    gone = (await api.post(base, json={"name": "bread"}, headers=headers)).json()
+    other = (await api.post("/api/lists", json={"name": "Party"}, headers=headers)).json()
+    since = (await delta(api, headers, 0))["version"]
+
+    # Another device deletes an item and a list...
+    await api.delete(f"{base}/{gone['id']}", headers=headers)
+    await api.delete(f"/api/lists/{other['id']}", headers=headers)
+
+    # ...then this one pushes everything it still has
+    push = {
+        "lists": [{"id": lst["id"], "name": "Weekly"}, {"id": other["id"], "name": "Party"}],
+        "items": [{"id": item["id"], "list_id": lst["id"], "name": item["name"]} for item in (kept, gone)],
+        "since_version": since,
+    }
+    response = await api.post("/api/sync", json=push, headers=headers)
+    assert response.status_code == 200, response.text
+    assert {(tomb["kind"], tomb["id"]) for tomb in response.json()["deleted"]} == {("item", gone["id"]), ("list", other["id"])}
+
+    names = [item["name"] for item in (await api.get(base, headers=headers)).json()]
+    assert names == ["milk"]
+    assert [found["id"] for found in (await api.get("/api/lists", headers=headers)).json()] == [lst["id"]]